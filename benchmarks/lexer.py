@@ -0,0 +1,133 @@
+"""
+Throughput benchmark for the translator lexer.
+Compares the line slicing tokenizer translator.parser used to have against the single pass Parser.scan() in tokens per second.
+
+USAGE:
+
+$ python benchmarks/lexer.py [-m megabytes] [-r repeat]
+"""
+
+import sys
+import os
+import re
+import string
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from translator import parser
+
+def corpus(megabytes):
+  """
+  Build a Margs source buffer of roughly the given size by repeating the test programs.
+  megabytes (float): The approximate size of the buffer.
+  """
+  root = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'tests')
+  chunk = ''
+  for fn in sorted(os.listdir(root)):
+    if fn.endswith('.margs'):
+      chunk += open(os.path.join(root, fn), 'r').read().rstrip('\n') + '\n'
+  size = int(megabytes * 1024 * 1024)
+  return chunk * max(1, size / len(chunk))
+
+def _tokenize(tokens, line, line_num):
+  """
+  Tokenize a single stripped line by repeatedly slicing it, the way translator.parser did before Parser.scan().
+  tokens (list): The list to append the tokens to.
+  line (string): The line of source code to tokenize.
+  line_num (int): The line number of the line.
+  """
+  while line:
+    line = line.lstrip() #remove all leading whitespace
+    if not line: continue #skip if it's an empty line
+    if line[:2] in ('<=', '>=', '!=', '=='):
+      tokens.append(parser.Token(line[:2], parser.literal_words[line[:2]], line=line_num))
+      line = line[2:]
+    elif line[0] in ('<', '>', '+', '-', '*', '/', '(', ')', '{', '}', '=', ',', ';'):
+      tokens.append(parser.Token(line[0], parser.literal_words[line[0]], line=line_num))
+      line = line[1:]
+    else:
+      m = re.match('[a-zA-Z]\w*', line)
+      if m:
+        text = m.group()
+        if parser.literal_words.has_key(text):
+          t = parser.Token(text, parser.literal_words[text], line=line_num) #keyword
+        elif set(text).issubset(set(string.lowercase)):
+          t = parser.Token(text, parser.Token.IDENTIFIER, line=line_num) #identifier
+        else:
+          t = parser.Token(text, parser.Token.ILLEGAL, False, line=line_num) #is all alphanumeric but contains uppercase and isnt a keyword
+        tokens.append(t)
+        line = line[len(text):]
+      else:
+        m = re.match('[\.\d]+', line) #numeric regex (not perfect, fails for 1.2.3.4)
+        if m: #numbers
+          text = m.group()
+          tokens.append(parser.Token(text, parser.Token.NUMBER, line=line_num))
+          line = line[len(text):]
+        else: #illegal token
+          m = re.match('(\S)\s', line) #illegal, so we'll get everything before the next space
+          text = m.group(1)
+          tokens.append(parser.Token(text, parser.Token.ILLEGAL, False, line=line_num))
+          line = line[len(text):]
+
+def line_lexer(source):
+  """
+  Tokenize the way Parser.parse() used to: strip every line and slice it with _tokenize().
+  source (string): The source code to tokenize.
+  """
+  tokens = list()
+  line_num = 0
+  for line in source.split('\n'):
+    line_num += 1
+    line = line.strip()
+    if len(line) == 0: continue
+    _tokenize(tokens, line, line_num)
+  return tokens
+
+def master_lexer(source):
+  """
+  Tokenize with the precompiled master pattern used by Parser.parse().
+  source (string): The source code to tokenize.
+  """
+  p = parser.Parser(None)
+  p.scan(source)
+  return p.tokens
+
+def measure(lexer, source, repeat):
+  """
+  Run a lexer repeat times and return the token count and the best time.
+  lexer (function): The lexer to measure.
+  source (string): The source code to tokenize.
+  repeat (int): The number of runs.
+  """
+  best, count = None, 0
+  for i in range(repeat):
+    begin = time.time()
+    count = len(lexer(source))
+    elapsed = time.time() - begin
+    if best == None or elapsed < best:
+      best = elapsed
+  return count, best
+
+if __name__ == '__main__':
+  from optparse import OptionParser
+  op = OptionParser(usage='python %prog [-m megabytes] [-r repeat]')
+  op.add_option('-m', '--megabytes', action='store', type='float', dest='megabytes', default=4.0, help='Size of the generated input.')
+  op.add_option('-r', '--repeat', action='store', type='int', dest='repeat', default=3, help='Runs per lexer, the best is reported.')
+  (options, args) = op.parse_args()
+
+  source = corpus(options.megabytes)
+
+  old = line_lexer(source)
+  new = master_lexer(source)
+  if [(t.text, t.type, t.line) for t in old] != [(t.text, t.type, t.line) for t in new]:
+    sys.exit('*** FATAL: the lexers produced different tokens')
+  del old, new
+
+  print 'Input: %.1f MB' % (len(source) / 1024.0 / 1024.0)
+  results = list()
+  for name, lexer in (('tokenize', line_lexer), ('scan', master_lexer)):
+    count, best = measure(lexer, source, options.repeat)
+    results.append(count / best)
+    print '%-10s %10d tokens %8.3f s %12.0f tokens/s' % (name, count, best, count / best)
+  print 'Speedup: %.2fx' % (results[1] / results[0])
@@ -0,0 +1,95 @@
+"""
+Memory used by the simulator AST of a generated workload (see workload.py).
+The workload is translated to PL/0, parsed and turned into an AST, then every object reachable from the AST (nodes, lists, tokens and strings) is counted once and sized with sys.getsizeof, including the instance __dict__ of the objects which have one.
+
+USAGE:
+
+$ python benchmarks/memory.py [-s statements] [-f functions] [-d depth] [-t trips] [--seed seed] [-o results.json]
+"""
+
+import sys
+import os
+import json
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.append(root + os.sep + 'simulator')
+sys.path.append(root + os.sep + 'translator')
+
+from translator import parser
+from translator import compiler
+from simulator import main
+from simulator import astnodes
+from simulator import resolve
+
+import workload
+
+def footprint(tree):
+  """
+  Returns (bytes, objects, nodes) of everything reachable from an AST.
+  tree (ASTNode): The root of the tree.
+  """
+  seen = set()
+  size, objects, nodes = 0, 0, 0
+  pending = [tree]
+  while pending:
+    obj = pending.pop()
+    if id(obj) in seen or obj is None or isinstance(obj, (int, long, bool)):
+      continue
+    seen.add(id(obj))
+    size += sys.getsizeof(obj)
+    objects += 1
+    if isinstance(obj, astnodes.ASTNode):
+      nodes += 1
+    if isinstance(obj, (list, tuple)):
+      pending.extend(obj)
+      continue
+    if isinstance(obj, basestring):
+      continue
+    fields = getattr(obj, '__dict__', None)
+    if fields is not None:
+      if id(fields) not in seen:
+        seen.add(id(fields))
+        size += sys.getsizeof(fields)
+      pending.extend(fields.values())
+    for cls in type(obj).__mro__:
+      for name in cls.__dict__.get('__slots__', ()):
+        pending.append(getattr(obj, name, None))
+  return size, objects, nodes
+
+def measure(source):
+  """
+  Translates a Margs source, builds the AST the engines run and returns its footprint as a dict.
+  source (string): The Margs source code.
+  """
+  p = parser.Parser(None)
+  p.source = source
+  p.parse()
+  c = compiler.Compiler(p.tokens)
+  c.run()
+  tree = main._genAstFromString(str(c))
+  resolve.resolve(tree) #the engines add their slots before running
+  size, objects, nodes = footprint(tree)
+  return {'bytes' : size, 'objects' : objects, 'nodes' : nodes, 'bytes_per_node' : float(size) / max(nodes, 1)}
+
+if __name__ == '__main__':
+  from optparse import OptionParser
+  op = OptionParser(usage='python %prog [-s statements] [-f functions] [-d depth] [-t trips] [--seed seed] [-o results.json]')
+  op.add_option('-s', '--statements', action='store', type='int', dest='statements', default=2000, help='Approximate number of statements.')
+  op.add_option('-f', '--functions', action='store', type='int', dest='functions', default=20, help='Number of functions.')
+  op.add_option('-d', '--depth', action='store', type='int', dest='depth', default=3, help='Deepest nesting of blocks.')
+  op.add_option('-t', '--trips', action='store', type='int', dest='trips', default=3, help='Trip count of every loop.')
+  op.add_option('--seed', action='store', type='int', dest='seed', default=0, help='Seed of the workload generator.')
+  op.add_option('-o', '--output', action='store', dest='output', help='Write the results to this JSON file.')
+  (options, args) = op.parse_args()
+
+  w = workload.Workload(options.statements, options.functions, options.depth, options.trips, options.seed)
+  results = measure(w.generate())
+  results['workload'] = w.config()
+  print 'Workload: ' + json.dumps(results['workload'], sort_keys=True)
+  print '%d AST nodes, %d objects, %d bytes, %.1f bytes per node' % (results['nodes'], results['objects'], results['bytes'], results['bytes_per_node'])
+
+  if options.output:
+    f = open(options.output, 'w')
+    json.dump(results, f, indent=2, separators=(',', ': '), sort_keys=True)
+    f.close()
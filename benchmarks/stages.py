@@ -0,0 +1,215 @@
+"""
+Per stage benchmark of the translator and the simulator on a generated workload (see workload.py).
+Every stage is timed separately and the median of the runs is kept:
+
+  translator.parse     Parser.parse, tokenizing the Margs source
+  translator.build     Compiler.build, building the node tree
+  translator.clean     Compiler.clean, cleaning the node tree for PL/0
+  translator.optimize  Compiler.optimize, folding constants, dropping dead code and inlining
+  translator.compile   Compiler.compile, generating the PL/0 code
+  simulator.scan       scanner, tokenizing the PL/0 code
+  simulator.parse      parser.parse, scanning and parsing the PL/0 code
+  simulator.astgen     astgen.traverse
+  simulator.interpret  interpret() of the chosen engine
+
+The results are written to a JSON file and compared with a stored baseline of the same engine, stages slower than the baseline by more than the threshold are reported as regressions. Stages which take less than MIN_SECONDS are too short to be timed reliably and are never reported.
+
+USAGE:
+
+$ python benchmarks/stages.py [-s statements] [-f functions] [-d depth] [-t trips] [--seed seed] [-e engine] [-r repeat] [-o results.json] [-b baseline.json] [--save-baseline] [--threshold ratio]
+"""
+
+import sys
+import os
+import time
+import json
+import platform
+from cStringIO import StringIO
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.append(root + os.sep + 'simulator')
+sys.path.append(root + os.sep + 'translator')
+
+from translator import parser
+from translator import compiler
+from simulator import scanner
+from simulator import parser as simparser
+from simulator import astgen
+
+import workload
+
+STAGES = ['translator.parse', 'translator.build', 'translator.clean', 'translator.optimize', 'translator.compile',
+  'simulator.scan', 'simulator.parse', 'simulator.astgen', 'simulator.interpret']
+
+#default file of the stored baselines, one per engine
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+#stages faster than this in the baseline are not checked for regressions
+MIN_SECONDS = 0.005
+
+def run(source, engine_name):
+  """
+  Runs every stage once on a Margs source and returns (seconds per stage, sizes, program output).
+  source (string): The Margs source code.
+  engine_name (string): The simulator engine running the program (see run.ENGINES).
+  """
+  import run as cli
+  times = dict()
+
+  begin = time.time()
+  p = parser.Parser(None)
+  p.source = source
+  p.parse()
+  times['translator.parse'] = time.time() - begin
+  if len(p.errors) > 0:
+    sys.exit('*** FATAL: the workload does not tokenize:\n' + '\n'.join(p.errors))
+
+  #the stages of Compiler.run(), timed one by one
+  c = compiler.Compiler(p.tokens)
+  for stage in ('build', 'clean', 'optimize', 'compile'):
+    begin = time.time()
+    getattr(c, stage)()
+    times['translator.' + stage] = time.time() - begin
+  begin = time.time()
+  code = str(c)
+  times['translator.compile'] += time.time() - begin
+
+  begin = time.time()
+  scanner.init(StringIO(code))
+  count = 0
+  while scanner.nexttoken().tokentype != scanner.Token.EOF:
+    count += 1
+  times['simulator.scan'] = time.time() - begin
+
+  begin = time.time()
+  tree = simparser.parse(StringIO(code))
+  times['simulator.parse'] = time.time() - begin
+
+  begin = time.time()
+  ast = astgen.traverse(tree)
+  times['simulator.astgen'] = time.time() - begin
+
+  out = StringIO()
+  begin = time.time()
+  cli.execute(ast, out, engine_name)
+  times['simulator.interpret'] = time.time() - begin
+
+  sizes = {'margs_bytes' : len(source), 'margs_tokens' : len(p.tokens), 'pl0_bytes' : len(code), 'pl0_tokens' : count}
+  return times, sizes, out.getvalue()
+
+def measure(source, engine_name, repeat):
+  """
+  Runs the stages repeat times and returns (median seconds per stage, sizes).
+  source (string): The Margs source code.
+  engine_name (string): The simulator engine running the program.
+  repeat (int): The number of runs.
+  """
+  samples, sizes, output = dict([(stage, list()) for stage in STAGES]), None, None
+  for i in range(repeat):
+    times, sizes, observed = run(source, engine_name)
+    if output != None and observed != output:
+      sys.exit('*** FATAL: the runs produced different output')
+    output = observed
+    for stage in STAGES:
+      samples[stage].append(times[stage])
+  return dict([(stage, median(samples[stage])) for stage in STAGES]), sizes
+
+def median(values):
+  """
+  Returns the median of a list of numbers.
+  values (list): The numbers, at least one.
+  """
+  values = sorted(values)
+  middle = len(values) // 2
+  return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2.0
+
+def load_baselines(path):
+  """
+  Returns the stored baselines of a file as a dict engine : results, empty when the file does not exist.
+  path (string): The baseline JSON file. A file holding the results of a single engine is read too.
+  """
+  if not os.path.exists(path):
+    return dict()
+  data = json.load(open(path, 'r'))
+  if 'stages' in data:
+    data = {data.get('engine') : data}
+  return data
+
+def compare(results, baseline, threshold):
+  """
+  Prints the results next to the baseline and returns the stages which regressed.
+  results (dict): The results of this run.
+  baseline (dict): The stored results of the same engine, or None.
+  threshold (float): Ratio to the baseline above which a stage regressed.
+  """
+  regressions = list()
+  if baseline == None:
+    print '*** WARNING: no baseline for the ' + results['engine'] + ' engine'
+  elif baseline.get('workload') != results['workload']:
+    print '*** WARNING: the baseline was measured on a different workload ' + json.dumps(baseline.get('workload'), sort_keys=True)
+  print '%-22s %10s %10s %8s' % ('stage', 'seconds', 'baseline', 'ratio')
+  for stage in STAGES:
+    now = results['stages'][stage]
+    then = baseline['stages'].get(stage) if baseline != None else None
+    if then:
+      ratio = now / then
+      flag = ''
+      if ratio > threshold and then >= MIN_SECONDS:
+        flag = '  REGRESSION'
+        regressions.append(stage)
+      print '%-22s %10.4f %10.4f %7.2fx%s' % (stage, now, then, ratio, flag)
+    else:
+      print '%-22s %10.4f %10s %8s' % (stage, now, '-', '-')
+  total = sum(results['stages'].values())
+  print '%-22s %10.4f' % ('total', total)
+  return regressions
+
+if __name__ == '__main__':
+  from optparse import OptionParser
+  import run as cli
+  op = OptionParser(usage='python %prog [-s statements] [-f functions] [-d depth] [-t trips] [--seed seed] [-e engine] [-r repeat] [-o results.json] [-b baseline.json] [--save-baseline] [--threshold ratio]')
+  op.add_option('-s', '--statements', action='store', type='int', dest='statements', default=2000, help='Approximate number of statements.')
+  op.add_option('-f', '--functions', action='store', type='int', dest='functions', default=20, help='Number of functions.')
+  op.add_option('-d', '--depth', action='store', type='int', dest='depth', default=3, help='Deepest nesting of blocks.')
+  op.add_option('-t', '--trips', action='store', type='int', dest='trips', default=3, help='Trip count of every loop.')
+  op.add_option('--seed', action='store', type='int', dest='seed', default=0, help='Seed of the workload generator.')
+  op.add_option('-e', '--engine', action='store', type='choice', choices=cli.ENGINES, dest='engine', default='tree', help='Simulator engine: ' + ', '.join(cli.ENGINES) + ' (default: tree).')
+  op.add_option('-r', '--repeat', action='store', type='int', dest='repeat', default=5, help='Runs of every stage, the median is reported.')
+  op.add_option('-o', '--output', action='store', dest='output', help='Write the results to this JSON file.')
+  op.add_option('-b', '--baseline', action='store', dest='baseline', default=BASELINE, help='Baseline JSON file to compare with (default: benchmarks/baseline.json).')
+  op.add_option('--save-baseline', action='store_true', dest='save_baseline', default=False, help='Store the results as the new baseline of the engine.')
+  op.add_option('--threshold', action='store', type='float', dest='threshold', default=1.5, help='Ratio to the baseline above which a stage is reported as a regression (default: 1.5).')
+  (options, args) = op.parse_args()
+
+  w = workload.Workload(options.statements, options.functions, options.depth, options.trips, options.seed)
+  source = w.generate()
+  stages, sizes = measure(source, options.engine, options.repeat)
+  results = {
+    'workload' : w.config(),
+    'engine' : options.engine,
+    'repeat' : options.repeat,
+    'python' : platform.python_version(),
+    'sizes' : sizes,
+    'stages' : stages
+  }
+
+  baselines = load_baselines(options.baseline)
+  baseline = baselines.get(options.engine) if not options.save_baseline else None
+
+  print 'Workload: ' + json.dumps(results['workload'], sort_keys=True) + ', ' + json.dumps(sizes, sort_keys=True)
+  regressions = compare(results, baseline, options.threshold)
+
+  if options.output:
+    f = open(options.output, 'w')
+    json.dump(results, f, indent=2, separators=(',', ': '), sort_keys=True)
+    f.close()
+  if options.save_baseline:
+    baselines[options.engine] = results
+    f = open(options.baseline, 'w')
+    json.dump(baselines, f, indent=2, separators=(',', ': '), sort_keys=True)
+    f.close()
+    print 'Baseline saved to ' + options.baseline
+
+  if regressions:
+    sys.exit('*** REGRESSION: ' + ', '.join(regressions))
@@ -0,0 +1,169 @@
+"""
+Seeded generator of valid Margs programs for the benchmarks.
+The size of a program is set by the number of statements, functions, the nesting depth of the blocks and the trip count of every loop. The same arguments always produce the same program.
+
+USAGE:
+
+$ python benchmarks/workload.py [-s statements] [-f functions] [-d depth] [-t trips] [--seed seed] > program.margs
+"""
+
+import random
+
+#words the translator reserves, never generated as identifiers
+keywords = frozenset(['true', 'false', 'var', 'const', 'function', 'if', 'else', 'while'])
+
+#comparisons used in conditions
+comparisons = ['<', '<=', '>', '>=', '==', '!=']
+
+#values are kept small so the running time does not depend on big integers
+clamp = 1000
+
+def identifier(prefix, n):
+  """
+  Returns a unique identifier made of lowercase letters only.
+  prefix (string): Letters starting the identifier.
+  n (int): Number of the identifier, written in base 26 with the letters a to z.
+  """
+  letters = ''
+  while True:
+    letters = chr(ord('a') + n % 26) + letters
+    n = n / 26
+    if n == 0:
+      break
+  name = prefix + letters
+  assert name not in keywords
+  return name
+
+class Workload():
+  def __init__(self, statements = 200, functions = 4, depth = 2, trips = 10, seed = 0):
+    """
+    The Workload initializer
+    statements (int): Approximate number of statements in the program.
+    functions (int): Number of functions, each one only calls the functions defined before it.
+    depth (int): Deepest nesting of while and if blocks.
+    trips (int): Number of times every loop runs.
+    seed (int): Seed of the random choices.
+    """
+    self.statements = statements
+    self.functions = functions
+    self.depth = depth
+    self.trips = trips
+    self.seed = seed
+
+  def config(self):
+    """
+    Returns the arguments of the workload as a dict.
+    """
+    return {'statements' : self.statements, 'functions' : self.functions, 'depth' : self.depth, 'trips' : self.trips, 'seed' : self.seed}
+
+  def generate(self):
+    """
+    Returns the Margs source code of the program.
+    """
+    self.random = random.Random(self.seed)
+    self.counters = 0 #loop counters generated so far, every loop gets its own
+    self.lines = list()
+    globals_ = [identifier('gv', i) for i in range(4)]
+    self.lines.append('var ' + ', '.join(['%s = %d' % (g, i + 1) for i, g in enumerate(globals_)]) + ';')
+
+    #the statement budget is shared between the functions and the main program
+    budget = self.statements / (self.functions + 1)
+    names = list()
+    for i in range(self.functions):
+      name = identifier('fn', i)
+      params = [identifier('p' + name, j) for j in range(self.random.randint(0, 2))]
+      local = identifier('l' + name, 0)
+      self.lines.append('function %s(%s){' % (name, ', '.join(params)))
+      counters = list()
+      body = list()
+      self.block(body, 1, globals_ + params + [local], names, budget, counters)
+      if counters:
+        self.lines.append('  var ' + ', '.join(counters) + ';')
+      self.lines.append('  var %s;' % local)
+      self.lines.append('  %s = %d;' % (local, self.random.randint(1, 9)))
+      self.lines.extend(body)
+      self.lines.append('}')
+      names.append((name, len(params)))
+
+    counters = list()
+    body = list()
+    self.block(body, 0, globals_, names, max(1, self.statements - budget * self.functions), counters)
+    if counters:
+      self.lines.append('var ' + ', '.join(counters) + ';')
+    self.lines.extend(body)
+    for g in globals_:
+      self.lines.append('OUTPUT %s;' % g)
+    return '\n'.join(self.lines) + '\n'
+
+  def block(self, out, indent, variables, functions, budget, counters, depth = 0):
+    """
+    Appends statements to out until the budget is spent and returns the number of statements appended.
+    out (list): Lines of code to append to.
+    indent (int): Indentation of the lines.
+    variables (list): Variables which can be read and written.
+    functions (list): (name, parameter count) of the functions which can be called.
+    budget (int): Number of statements to generate.
+    counters (list): Loop counters which have to be declared by the caller.
+    depth (int): Current nesting depth.
+    """
+    pad = '  ' * indent
+    used = 0
+    while used < budget:
+      kind = self.random.random()
+      if depth < self.depth and kind < 0.15:
+        counter = identifier('cv', self.counters)
+        self.counters += 1
+        counters.append(counter)
+        out.append(pad + '%s = 0;' % counter)
+        out.append(pad + 'while(%s < %d){' % (counter, self.trips))
+        used += 2 + self.block(out, indent + 1, variables, functions, min(budget - used, 4), counters, depth + 1)
+        out.append(pad + '  %s = %s + 1;' % (counter, counter))
+        out.append(pad + '}')
+      elif depth < self.depth and kind < 0.3:
+        out.append(pad + 'if(%s %s %s){' % (self.random.choice(variables), self.random.choice(comparisons), self.random.randint(0, 20)))
+        used += 1 + self.block(out, indent + 1, variables, functions, min(budget - used, 3), counters, depth + 1)
+        out.append(pad + '} else {')
+        used += self.block(out, indent + 1, variables, functions, min(budget - used, 2), counters, depth + 1)
+        out.append(pad + '}')
+      elif functions and kind < 0.4:
+        name, count = self.random.choice(functions)
+        args = [self.random.choice([self.random.choice(variables), str(self.random.randint(0, 9))]) for i in range(count)]
+        out.append(pad + '%s(%s);' % (name, ', '.join(args)))
+        used += 1
+      else:
+        target = self.random.choice(variables)
+        out.append(pad + '%s = %s;' % (target, self.expression(variables)))
+        out.append(pad + 'if(%s > %d){ %s = %s / 7; }' % (target, clamp, target, target))
+        out.append(pad + 'if(%s < -%d){ %s = %s / 7; }' % (target, clamp, target, target))
+        used += 3
+    return used
+
+  def expression(self, variables):
+    """
+    Returns a random expression over variables and small numbers. Only numbers are used as divisors.
+    variables (list): Variables which can be read.
+    """
+    def factor():
+      if self.random.random() < 0.6:
+        return self.random.choice(variables)
+      return str(self.random.randint(1, 9))
+    code = factor()
+    for i in range(self.random.randint(1, 3)):
+      op = self.random.choice(['+', '-', '*', '/'])
+      if op == '/':
+        code = '(%s) / %d' % (code, self.random.randint(2, 9))
+      else:
+        code = '%s %s %s' % (code, op, factor())
+    return code
+
+if __name__ == '__main__':
+  from optparse import OptionParser
+  op = OptionParser(usage='python %prog [-s statements] [-f functions] [-d depth] [-t trips] [--seed seed]')
+  op.add_option('-s', '--statements', action='store', type='int', dest='statements', default=200, help='Approximate number of statements.')
+  op.add_option('-f', '--functions', action='store', type='int', dest='functions', default=4, help='Number of functions.')
+  op.add_option('-d', '--depth', action='store', type='int', dest='depth', default=2, help='Deepest nesting of blocks.')
+  op.add_option('-t', '--trips', action='store', type='int', dest='trips', default=10, help='Trip count of every loop.')
+  op.add_option('--seed', action='store', type='int', dest='seed', default=0, help='Seed of the random choices.')
+  (options, args) = op.parse_args()
+
+  print Workload(options.statements, options.functions, options.depth, options.trips, options.seed).generate(),
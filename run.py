@@ -6,6 +6,40 @@ sys.path.append(sys.path[0] + os.sep + 'simulator')
 sys.path.append(sys.path[0] + os.sep + 'translator')
 
 MARGS_EXT = '.margs'
+PL0_EXT = '.pl0'
+
+#simulator engines selectable with --engine
+ENGINES = ('tree', 'closure', 'vm', 'pycode')
+
+#on-disk translation cache (translator.cache.Cache), set up from the command line options
+CACHE = None
+#whether the cache also keeps the simulator AST of translated programs
+CACHE_AST = False
+
+#size in statements up to which the translator inlines functions, None for translator.compiler.INLINE_THRESHOLD
+INLINE = None
+
+#profiler of the tree engine (simulator.profiler.Profiler), set up by --profile and --flamegraph
+PROFILER = None
+
+#environment variable that can name the socket of a server (see server.py)
+SOCKET_ENV = 'MARGS_SOCKET'
+
+def engine(name):
+  """
+  Returns the simulator module of the given engine name, its Interpreter class runs programs and its interpret() runs one with sys.stdin and sys.stdout
+  name (text): one of ENGINES
+  """
+  from simulator import interp
+  from simulator import closure
+  from simulator import vm
+  from simulator import pycode
+  return {
+    'tree' : interp,
+    'closure' : closure,
+    'vm' : vm,
+    'pycode' : pycode
+  }[name]
 
 def tokenize(infile, outfile = None):
   """
@@ -23,102 +57,483 @@ def tokenize(infile, outfile = None):
   else:
     print str(p)
   
-def translate(infile, outfile = None):
+def compile_margs(infile, source = None):
   """
-  Translates a given input file and writes the output to the given outfile or screen
-  infile (text): input file to translate
-  outfile (text, optional): output file to write to
+  Translates a given input Margs file and returns the compiler holding the PL/0 code
+  infile (text): input file to translate, or the name of the source
+  source (text, optional): Margs source code to translate instead of reading infile
   """
   
   from translator import parser
   from translator import compiler
   
-  p = parser.Parser(infile).loadFile().parse()
+  p = parser.Parser(infile)
+  tokens = p.stream(source) #tokens are read lazily while compiling
   if len(p.errors) > 0:
     quit('ERRORS:\n' + '\n'.join(p.errors))
-  c = compiler.Compiler(p.tokens)
+  c = compiler.Compiler(tokens) if INLINE == None else compiler.Compiler(tokens, INLINE)
   c.run()
+  return c
+
+def translate_margs(infile, source = None):
+  """
+  Translates a given input Margs file and returns (the PL/0 code, its translator.sourcemap.SourceMap). Consults CACHE first when it is set up.
+  infile (text): input file to translate, or the name of the source
+  source (text, optional): Margs source code to translate instead of reading infile
+  """
+  
+  from translator import sourcemap
+  from translator import cache
+  from cStringIO import StringIO
+  
+  if CACHE == None or (source == None and not os.path.isfile(infile)):
+    c = compile_margs(infile, source)
+    return str(c), sourcemap.build(c.compiled, infile)
+  key = CACHE.key(source if source != None else open(infile, 'rb').read(), 'inline=' + str(INLINE))
+  #the code and its map make one translation, counted once
+  code, smap = CACHE.get(key, count = False), CACHE.get(key, cache.MAP_EXT, count = False)
+  CACHE.count(code != None and smap != None)
+  if code == None or smap == None:
+    c = compile_margs(infile, source)
+    code, smap = str(c), sourcemap.build(c.compiled, infile)
+    out = StringIO()
+    smap.save(out)
+    CACHE.put(key, code)
+    CACHE.put(key, out.getvalue(), cache.MAP_EXT)
+    return code, smap
+  return code, sourcemap.load(StringIO(smap))
+
+def load_margs(infile, source = None):
+  """
+  Translates a given input Margs file and returns (the simulator AST of the PL/0 code, its SourceMap). With CACHE_AST the AST itself is cached.
+  infile (text): input file to translate, or the name of the source
+  source (text, optional): Margs source code to translate instead of reading infile
+  """
+  
+  from simulator import main
+  from translator import cache
+  
+  code, smap = translate_margs(infile, source)
+  if CACHE == None or not CACHE_AST or (source == None and not os.path.isfile(infile)):
+    return main._genAstFromString(code), smap
+  simulator_version = cache.fingerprint(sys.path[0] + os.sep + 'simulator')
+  key = CACHE.key(source if source != None else open(infile, 'rb').read(), 'inline=' + str(INLINE), simulator_version)
+  ast = CACHE.get_ast(key, False) #translate_margs counted the translation
+  if ast == None:
+    ast = main._genAstFromString(code)
+    CACHE.put_ast(key, ast)
+  return ast, smap
+
+def translate(infile, outfile = None, sourcemap_file = None):
+  """
+  Translates a given input file and writes the output to the given outfile or screen
+  infile (text): input file to translate
+  outfile (text, optional): output file to write to
+  sourcemap_file (text, optional): file to write the map from the PL/0 lines to the Margs lines to
+  """
+  
+  code, smap = translate_margs(infile)
   if outfile != None:
     f = open(outfile, 'w')
-    f.write(str(c))
+    f.write(code)
     f.close()
   else:
-    print str(c)
+    print code
+  if sourcemap_file != None:
+    smap.save(sourcemap_file)
 
-def simulate(infile, outfile = None):
+def simulate(infile, outfile = None, engine_name = 'tree', sourcemap_file = None, stdin = None):
   """
   Simulates a given PL/0. Makes use of external pypl0 library.
   infile (text): input file to translate
-  outfile (text, optional): file to write results to
+  outfile (text or file, optional): file to write results to
+  engine_name (text, optional): simulator engine to run the program with (see ENGINES)
+  sourcemap_file (text, optional): source map written by translate, errors and profiles then name the Margs lines
+  stdin (file, optional): file the program reads @ from, defaults to sys.stdin
   """
   
-  from simulator import interp
   from simulator import main
+  from translator import sourcemap
+  smap = sourcemap.load(sourcemap_file) if sourcemap_file != None else None
+  execute(main._genAstFromFile(infile), outfile, engine_name, smap, stdin)
+
+def execute(ast, outfile = None, engine_name = 'tree', smap = None, stdin = None):
+  """
+  Runs a simulator AST and writes the results to the given outfile or screen. The program gets an Interpreter of its own, sys.stdin and sys.stdout are left alone.
+  ast (Program): abstract syntax tree generated by the simulator
+  outfile (text or file, optional): file name or open file to write results to
+  engine_name (text, optional): simulator engine to run the program with (see ENGINES)
+  smap (SourceMap, optional): map of the PL/0 lines to Margs lines, used to annotate errors and profiles
+  stdin (file, optional): file the program reads @ from, defaults to sys.stdin
+  """
   
-  if outfile != None: #overwrite stdout
-    sys.stdout = open(outfile,'w')
-  interp.interpret(main._genAstFromFile(infile))
-  if outfile != None: #restore stdout
-    sys.stdout.close()
-    sys.stdout = sys.__stdout__
+  out = open(outfile, 'w') if isinstance(outfile, str) else outfile
+  try:
+    if PROFILER != None: #the profiler runs the program with the tree engine
+      if smap != None:
+        PROFILER.linemap = smap.describe
+      PROFILER.run(ast, stdin, out)
+    else:
+      engine(engine_name).Interpreter(stdin, out).run(ast)
+  except Exception, e:
+    annotate(e, smap)
+    raise
+  finally:
+    if isinstance(outfile, str):
+      out.close()
 
-def both(infile, outfile = None):
-  from translator import parser
-  from translator import compiler
+def annotate(e, smap):
+  """
+  Points the message of a simulator error at the Margs line
+  e (Exception): error raised by a simulator engine
+  smap (SourceMap or None): map of the PL/0 lines to Margs lines of the program
+  """
+  if smap != None and len(e.args) == 1 and isinstance(e.args[0], str):
+    e.args = (smap.annotate(e.args[0]), )
+
+def disassemble(infile, outfile = None):
   """
-  Translates and Simulates a given input Margs file.
+  Compiles a given PL/0 program to the bytecode of the vm engine and writes the listing to the given outfile or screen
+  infile (text): input file to disassemble
+  outfile (text, optional): output file to write to
+  """
+  
+  from simulator import main
+  from simulator import vm
+  
+  listing = vm.disassemble(vm.assemble(main._genAstFromFile(infile)))
+  if outfile != None:
+    f = open(outfile, 'w')
+    f.write(listing + '\n')
+    f.close()
+  else:
+    print listing
+
+def both(infile, outfile = None, engine_name = 'tree', stdin = None):
+  """
+  Translates and Simulates a given input Margs file. The PL/0 code is handed to the simulator in memory.
   infile (text): input file to simulate
-  outfile (text, optional): file to write results to
+  outfile (text or file, optional): file to write results to
+  engine_name (text, optional): simulator engine to run the program with (see ENGINES)
+  stdin (file, optional): file the program reads @ from, defaults to sys.stdin
   """
-  p = parser.Parser(infile).loadFile().parse()
-  if len(p.errors) > 0:
-    quit('ERRORS:\n' + '\n'.join(p.errors))
-  c = compiler.Compiler(p.tokens)
-  c.run()
-  out = open('TEMP_FILE', 'w') #temporary output file (to send to simulator)
-  out.write(''.join([str(i) for i in c.compiled])) #the compiled code
-  out.close()
-  simulate('TEMP_FILE', outfile)
-  os.remove('TEMP_FILE') #clean up the temp file
+  
+  ast, smap = load_margs(infile)
+  execute(ast, outfile, engine_name, smap, stdin)
+
+def run_test(case):
+  """
+  Runs one test file through the compiler and simulator and returns its result as a dict.
+  Picklable so the process pool of tests() can call it.
+  case (tuple): (test file name, path of the test file, path of the expected file, engine name)
+  """
+  from cStringIO import StringIO
+  import time
+  
+  fn, fpath, epath, engine_name = case
+  result = {'name' : fn, 'status' : 'success', 'observed' : '', 'expected' : '', 'message' : ''}
+  if CACHE != None: #the workers count on their own copy, tests() adds up the differences
+    hits, misses = CACHE.hits, CACHE.misses
+  begin = time.time()
+  try:
+    expected = open(epath, 'r').readlines()[0].strip() #first line of expected test
+    result['expected'] = expected
+    out = StringIO() #observed output is captured in memory
+    both(fpath, out, engine_name)
+    observed = out.getvalue().split('\n')[0].strip() #first line of observed test
+    result['observed'] = observed
+    if observed != expected:
+      result['status'] = 'failed'
+  except SystemExit, e: #the translator quits on errors
+    result['status'], result['message'] = 'error', str(e.code)
+  except Exception, e:
+    result['status'], result['message'] = 'error', '%s: %s' % (e.__class__.__name__, e)
+  result['time'] = time.time() - begin
+  if CACHE != None:
+    result['cache_hits'], result['cache_misses'] = CACHE.hits - hits, CACHE.misses - misses
+  return result
+
+def write_junit(results, outfile, elapsed):
+  """
+  Writes test results as a JUnit XML report
+  results (list): dicts returned by run_test
+  outfile (text): output file to write to
+  elapsed (float): wall time of the whole run in seconds
+  """
+  from xml.sax.saxutils import quoteattr, escape
+  
+  failures = len([r for r in results if r['status'] == 'failed'])
+  errors = len([r for r in results if r['status'] == 'error'])
+  f = open(outfile, 'w')
+  f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+  f.write('<testsuite name="margs" tests="%d" failures="%d" errors="%d" time="%.3f">\n' % (len(results), failures, errors, elapsed))
+  for r in results:
+    f.write('  <testcase classname="tests" name=%s time="%.3f"' % (quoteattr(r['name']), r['time']))
+    if r['status'] == 'failed':
+      f.write('>\n    <failure message=%s>%s</failure>\n  </testcase>\n' % (
+        quoteattr('observed %r, expected %r' % (r['observed'], r['expected'])), escape(r['observed'])))
+    elif r['status'] == 'error':
+      f.write('>\n    <error message=%s/>\n  </testcase>\n' % quoteattr(r['message']))
+    else:
+      f.write('/>\n')
+  f.write('</testsuite>\n')
+  f.close()
 
-def tests():
+def write_json(results, outfile, elapsed):
+  """
+  Writes test results as a JSON summary
+  results (list): dicts returned by run_test
+  outfile (text): output file to write to
+  elapsed (float): wall time of the whole run in seconds
+  """
+  import json
+  
+  summary = {
+    'tests' : len(results),
+    'success' : len([r for r in results if r['status'] == 'success']),
+    'failed' : len([r for r in results if r['status'] == 'failed']),
+    'errors' : len([r for r in results if r['status'] == 'error']),
+    'time' : elapsed,
+    'results' : results
+  }
+  f = open(outfile, 'w')
+  json.dump(summary, f, indent=2, sort_keys=True)
+  f.close()
+
+def run_cases(function, cases, jobs = None):
+  """
+  Returns (an iterator over the results of function for every case in order, the process pool running them or None). The caller terminates the pool.
+  function (function): picklable function taking one case
+  cases (list): the cases
+  jobs (int, optional): number of worker processes, defaults to the number of cores, 1 runs in this process
+  """
+  import multiprocessing
+  
+  if jobs == None:
+    jobs = multiprocessing.cpu_count()
+  if jobs > 1 and len(cases) > 1:
+    pool = multiprocessing.Pool(min(jobs, len(cases)))
+    return pool.imap(function, cases, max(1, len(cases) / (jobs * 4))), pool
+  return (function(case) for case in cases), None
+
+def tests(engine_name = 'tree', jobs = None, junit = None, json_file = None):
+  """
+  Runs every test file through the compiler and simulator and compares the first line of output with the expected file.
+  engine_name (text, optional): simulator engine to run the tests with (see ENGINES)
+  jobs (int, optional): number of worker processes, defaults to the number of cores, 1 runs in this process
+  junit (text, optional): file to write a JUnit XML report to
+  json_file (text, optional): file to write a JSON summary to
+  """
   from datetime import datetime
   
   print 'Beginning Testing'
   
-  old, errors, success, removes = sys.stdout, 0, 0, list()
+  errors, success = 0, 0
   
   begin = datetime.now()
   
-  for fn in os.listdir('tests'):
+  cases = list()
+  for fn in sorted(os.listdir('tests')):
     if fn.endswith(MARGS_EXT):
       fpath = 'tests' + os.sep + fn
       
       efn = fn.split(MARGS_EXT)[0] + '.expected' #expected filename
       epath = 'tests' + os.sep + efn
-      ofn = fn.split(MARGS_EXT)[0] + '.observed' #observed filename
-      opath = 'tests' + os.sep + ofn
       if not os.path.exists(epath):
         print '*** FATAL: Expected test file does not exist (' + efn + ')'
       else:
-        both(fpath, opath)
-        observed = open(opath, 'r').readlines()[0].strip() #firest line of observed test
-        expected = open(epath, 'r').readlines()[0].strip() #first line of expected test
-        if observed != expected:
-          errors += 1
-          print '*** FAILED: ' + fn
-          print '         OBSERVED: ' + observed 
-          print '         EXPECTED: ' + expected
+        cases.append((fn, fpath, epath, engine_name))
+  
+  outcomes, pool = run_cases(run_test, cases, jobs)
+  
+  results = list()
+  try:
+    for r in outcomes:
+      results.append(r)
+      if CACHE != None and pool != None:
+        CACHE.hits += r['cache_hits']
+        CACHE.misses += r['cache_misses']
+      if r['status'] == 'success':
+        print '    SUCCESS: ' + r['name'] + ' (%.3fs)' % r['time']
+        success += 1
+      else:
+        errors += 1
+        print '*** FAILED: ' + r['name'] + ' (%.3fs)' % r['time']
+        if r['status'] == 'error':
+          print '         ERROR:    ' + r['message']
         else:
-          print '    SUCCESS: ' + fn
-          success += 1
-        removes.append(opath)
+          print '         OBSERVED: ' + r['observed'] 
+          print '         EXPECTED: ' + r['expected']
+  finally:
+    if pool != None:
+      pool.terminate()
   
   end = datetime.now()
+  elapsed = (end - begin).total_seconds()
   
-  for f in removes: os.remove(f) #clean up temporary observed file
+  if junit != None:
+    write_junit(results, junit, elapsed)
+  if json_file != None:
+    write_json(results, json_file, elapsed)
   
   print 'End Testing.' + (' ' * 10) + 'Success: ' + str(success) + (' ' * 10) + 'Errors: ' + str(errors) + (' ' * 10) + 'Time: ' + str(end - begin)
+  return errors
+
+def batch_files(target):
+  """
+  Returns the Margs and PL/0 files of a batch in order.
+  target (text): a directory searched recursively, a manifest file listing one path per line (relative to the manifest, # starts a comment) or a glob pattern
+  """
+  import glob
+  
+  if os.path.isdir(target):
+    files = list()
+    for root, dirs, names in os.walk(target):
+      dirs.sort()
+      files.extend([os.path.join(root, fn) for fn in sorted(names) if fn.endswith(MARGS_EXT) or fn.endswith(PL0_EXT)])
+    return files
+  if os.path.isfile(target):
+    lines = [line.split('#')[0].strip() for line in open(target, 'r')]
+    return [os.path.join(os.path.dirname(target), line) for line in lines if line]
+  return sorted(glob.glob(target))
+
+def run_batch(case):
+  """
+  Runs one file of a batch, both for Margs and simulate for PL/0, and returns its result as a dict. The text of the file with the extension .in next to it, if any, is read by @.
+  Picklable so the process pool of batch() can call it.
+  case (tuple): (path of the file, path of the output file or None to discard the output, engine name)
+  """
+  from cStringIO import StringIO
+  import time
+  
+  path, outpath, engine_name = case
+  result = {'name' : path, 'status' : 'success', 'output' : outpath, 'message' : ''}
+  if CACHE != None: #the workers count on their own copy, batch() adds up the differences
+    hits, misses = CACHE.hits, CACHE.misses
+  inpath = os.path.splitext(path)[0] + '.in'
+  begin = time.time()
+  try:
+    stdin = StringIO(open(inpath, 'r').read() if os.path.isfile(inpath) else '')
+    out = outpath if outpath != None else StringIO()
+    if path.endswith(MARGS_EXT):
+      both(path, out, engine_name, stdin)
+    else:
+      simulate(path, out, engine_name, stdin = stdin)
+  except SystemExit, e: #the translator quits on errors
+    result['status'], result['message'] = 'error', str(e.code)
+  except Exception, e:
+    result['status'], result['message'] = 'error', '%s: %s' % (e.__class__.__name__, e)
+  result['time'] = time.time() - begin
+  if CACHE != None:
+    result['cache_hits'], result['cache_misses'] = CACHE.hits - hits, CACHE.misses - misses
+  return result
+
+def run_cooperative(cases, quantum = None):
+  """
+  Runs the cases of batch() at the same time as the tasks of one simulator.cooperative.Scheduler in this process, and returns an iterator over their results in order. The time of a file is the time its task ran.
+  cases (list): (path of the file, path of the output file or None to discard the output, engine name), the engine is always vm
+  quantum (int, optional): loop iterations and procedure calls in one turn of a task, defaults to simulator.cooperative.QUANTUM
+  """
+  from simulator import cooperative
+  from simulator import main
+  
+  scheduler = cooperative.Scheduler()
+  started = list()
+  for path, outpath, engine_name in cases:
+    result = {'name' : path, 'status' : 'success', 'output' : outpath, 'message' : ''}
+    task, smap = None, None
+    try:
+      if path.endswith(MARGS_EXT):
+        ast, smap = load_margs(path)
+      else:
+        ast = main._genAstFromFile(path)
+      task = scheduler.add(cooperative.Task(ast, quantum = quantum or cooperative.QUANTUM))
+      inpath = os.path.splitext(path)[0] + '.in'
+      if os.path.isfile(inpath):
+        task.stdin.write(open(inpath, 'r').read())
+      task.stdin.close()
+    except SystemExit, e: #the translator quits on errors
+      result['status'], result['message'] = 'error', str(e.code)
+    except Exception, e:
+      result['status'], result['message'] = 'error', '%s: %s' % (e.__class__.__name__, e)
+    started.append((result, task, smap))
+  
+  scheduler.run()
+  for result, task, smap in started:
+    result['time'] = task.time if task != None else 0.0
+    if task != None:
+      if result['output'] != None:
+        f = open(result['output'], 'w')
+        f.write(task.stdout.read())
+        f.close()
+      if task.error != None:
+        annotate(task.error, smap)
+        result['status'], result['message'] = 'error', '%s: %s' % (task.error.__class__.__name__, task.error)
+    yield result
+
+def batch(target, outdir = None, engine_name = 'tree', jobs = None, json_file = None, cooperative = False):
+  """
+  Runs many Margs and PL/0 files in one process or a pool of worker processes, so the start up and imports are paid once per worker, and prints the time of every file.
+  target (text): directory, manifest or glob pattern of the files (see batch_files)
+  outdir (text, optional): directory to write the output of every file to, as its path relative to the common directory of the files plus .out
+  engine_name (text, optional): simulator engine to run the files with (see ENGINES)
+  jobs (int, optional): number of worker processes, defaults to the number of cores, 1 runs in this process
+  json_file (text, optional): file to write a JSON summary to
+  cooperative (bool, optional): run every file at once in this process, interleaved by simulator.cooperative on the vm engine, instead of one after the other
+  """
+  from datetime import datetime
+  
+  files = batch_files(target)
+  if not files:
+    print '*** FATAL: No files found (' + target + ')'
+    return 1
+  
+  begin = datetime.now()
+  
+  base = os.path.commonprefix([os.path.dirname(os.path.abspath(f)) + os.sep for f in files])
+  base = base[:base.rfind(os.sep) + 1]
+  cases = list()
+  for f in files:
+    outpath = None
+    if outdir != None:
+      outpath = os.path.join(outdir, os.path.abspath(f)[len(base):] + '.out')
+      if not os.path.isdir(os.path.dirname(outpath)):
+        os.makedirs(os.path.dirname(outpath))
+    cases.append((f, outpath, engine_name))
+  
+  if cooperative:
+    outcomes, pool = run_cooperative(cases), None
+  else:
+    outcomes, pool = run_cases(run_batch, cases, jobs)
+  
+  results = list()
+  try:
+    for r in outcomes:
+      results.append(r)
+      if CACHE != None and pool != None:
+        CACHE.hits += r['cache_hits']
+        CACHE.misses += r['cache_misses']
+      if r['status'] == 'success':
+        print '    DONE:  ' + r['name'] + ' (%.3fs)' % r['time']
+      else:
+        print '*** ERROR: ' + r['name'] + ' (%.3fs)' % r['time']
+        print '         ' + r['message']
+  finally:
+    if pool != None:
+      pool.terminate()
+  
+  end = datetime.now()
+  elapsed = (end - begin).total_seconds()
+  
+  if json_file != None:
+    write_json(results, json_file, elapsed)
+  
+  errors = len([r for r in results if r['status'] == 'error'])
+  times = sorted([(r['time'], r['name']) for r in results])
+  print 'End Batch.' + (' ' * 10) + 'Files: ' + str(len(results)) + (' ' * 10) + 'Errors: ' + str(errors) + (' ' * 10) + 'Time: ' + str(end - begin)
+  print 'Per file: %.3fs total, %.3fs mean, %.3fs median, %.3fs max (%s)' % (
+    sum([t for t, name in times]), sum([t for t, name in times]) / len(times), times[len(times) / 2][0], times[-1][0], times[-1][1])
+  return errors
 
 
 if __name__ == '__main__':
@@ -127,6 +542,7 @@ if __name__ == '__main__':
     'tokenize' : tokenize,
     'translate' : translate,
     'simulate' : simulate,
+    'disassemble' : disassemble,
     'both' : both,
     'tests' : tests
   }
@@ -134,29 +550,131 @@ if __name__ == '__main__':
   from optparse import OptionParser
   parser = OptionParser(
       usage="""
-python %prog action [-o outputfile] infile
+python %prog action [-o outputfile] [-e engine] infile
+python %prog tests [-e engine] [-j jobs] [--junit file] [--json file]
+python %prog batch target [-o outputdir] [-e engine] [-j jobs] [--json file] [--cooperative]
+python %prog serve socket [-e engine]
+translate, simulate and both run on a server started by serve with --socket socket or $MARGS_SOCKET
+Translations are cached on disk with --cache-dir or $MARGS_CACHE_DIR
+simulate and both profile the tree engine with --profile and --flamegraph file
+translate writes and simulate reads the PL/0 to Margs line map with --sourcemap file
 Action is one of
 tokenize   -  Tokenize a program from Margs
 translate  -  Translate a program from Margs to PL/0 (Recommended)
 simulate   -  Simulate a program written in PL/0 assembly language
+disassemble - Print the vm engine bytecode of a program written in PL/0
 both       -  Translate and simulate a program written in Margs
+serve      -  Translate and simulate the programs sent to a Unix socket
+batch      -  Run the Margs and PL/0 files of a directory, manifest or glob pattern
 tests      -  Run all test files through compiler and simulator for expected output""")
 
-  parser.add_option('-o', '--outputfile', action='store', dest='outputfile', help='Output file.')
+  parser.add_option('-o', '--outputfile', action='store', dest='outputfile', help='Output file, or output directory for batch.')
+  parser.add_option('-e', '--engine', action='store', dest='engine', type='choice', choices=ENGINES,
+    help='Simulator engine for simulate, both, batch and tests: ' + ', '.join(ENGINES) + ' (default: tree, vm with --cooperative).')
+  parser.add_option('-j', '--jobs', action='store', dest='jobs', type='int',
+    help='Worker processes for tests and batch (default: number of cores).')
+  parser.add_option('--junit', action='store', dest='junit', help='Write a JUnit XML report of tests to this file.')
+  parser.add_option('--json', action='store', dest='json', help='Write a JSON summary of tests or batch to this file.')
+  parser.add_option('--cache-dir', action='store', dest='cache_dir',
+    help='Cache translations in this directory (default: $MARGS_CACHE_DIR, no caching when neither is set).')
+  parser.add_option('--cache-size', action='store', dest='cache_size', type='float', default=64.0,
+    help='Megabytes the cache may use before the least recently used entries are evicted (default: 64).')
+  parser.add_option('--cache-ast', action='store_true', dest='cache_ast', default=False,
+    help='Also cache the simulator AST of translated programs for both and tests.')
+  parser.add_option('--cache-stats', action='store_true', dest='cache_stats', default=False,
+    help='Print the cache hit and miss statistics to stderr when done.')
+  parser.add_option('--no-cache', action='store_true', dest='no_cache', default=False, help='Do not use the cache.')
+  parser.add_option('--sourcemap', action='store', dest='sourcemap',
+    help='Source map file written by translate and read by simulate to name the Margs lines in errors and profiles.')
+  parser.add_option('--stack-size', action='store', dest='stack_size', type='float',
+    help='Megabytes the vm engine may use for procedure frames, bounding the recursion depth (default: 64).')
+  parser.add_option('--inline', action='store', dest='inline', type='int',
+    help='Inline functions of at most this many statements at their call sites, 0 turns inlining off (default: 8).')
+  parser.add_option('--socket', action='store', dest='socket',
+    help='Send translate, simulate and both to the server listening on this Unix socket (default: $MARGS_SOCKET).')
+  parser.add_option('--input', action='store', dest='input',
+    help='File whose text is read by @ when running on a server, - for stdin.')
+  parser.add_option('--cooperative', action='store_true', dest='cooperative', default=False,
+    help='Run the files of batch all at once in this process, taking turns on the vm engine (the only engine it supports).')
+  parser.add_option('--profile', action='store_true', dest='profile', default=False,
+    help='Profile simulate and both with the tree engine and print the hot spots to stderr.')
+  parser.add_option('--flamegraph', action='store', dest='flamegraph',
+    help='Profile simulate and both with the tree engine and write the collapsed call stacks to this file.')
   (options, args) = parser.parse_args()
   
+  if options.cooperative and options.engine not in (None, 'vm'):
+    parser.error('--cooperative runs on the vm engine only.')
+  if options.engine == None:
+    options.engine = 'vm' if options.cooperative else 'tree'
+  
+  INLINE = options.inline
+  if options.stack_size != None:
+    from simulator import vm
+    vm.STACK_BUDGET = int(options.stack_size * 1024 * 1024)
+  
+  from translator import cache
+  if not options.no_cache and (options.cache_dir or os.environ.get(cache.CACHE_DIR_ENV)):
+    CACHE = cache.Cache(options.cache_dir, int(options.cache_size * 1024 * 1024))
+    CACHE_AST = options.cache_ast
+    if options.cache_stats:
+      import atexit
+      atexit.register(lambda: sys.stderr.write(str(CACHE) + '\n'))
+  
   if len(args) == 1 and args[0] == 'tests':
-    tests()
+    sys.exit(1 if tests(options.engine, options.jobs, options.junit, options.json) else 0)
   else:
     if len(args) != 2:
       parser.error('Wrong number of arguments.')
     
     action = args[0]
     infile = args[1]
-    if action in actions.keys() and len(args) == 2:
-      if hasattr(options, 'outputfile') and options.outputfile:
-        actions[action](infile, options.outputfile)
+    socket_path = options.socket or os.environ.get(SOCKET_ENV)
+    if action == 'batch':
+      sys.exit(1 if batch(infile, options.outputfile, options.engine, options.jobs, options.json, options.cooperative) else 0)
+    elif action == 'serve':
+      import server
+      server.serve(infile, options.engine, INLINE, CACHE, CACHE_AST)
+    elif socket_path and action in ('translate', 'simulate', 'both'): #the actions of server.ACTIONS
+      import server
+      if options.sourcemap or options.profile or options.flamegraph:
+        parser.error('--sourcemap, --profile and --flamegraph cannot be used with a server.')
+      payload = {'action' : action, 'source' : open(infile, 'r').read(), 'name' : infile, 'engine' : options.engine}
+      if options.input:
+        payload['input'] = sys.stdin.read() if options.input == '-' else open(options.input, 'r').read()
+      response = server.request(socket_path, payload)
+      if options.outputfile:
+        f = open(options.outputfile, 'w')
+        f.write(response['output'])
+        f.close()
+      elif action == 'translate':
+        print response['output']
       else:
-        actions[action](infile)
+        sys.stdout.write(response['output'])
+      if response['status'] != 'ok':
+        sys.exit(response['error'])
+    elif action in actions.keys() and len(args) == 2:
+      kwargs = dict()
+      if action in ('translate', 'simulate') and options.sourcemap:
+        kwargs['sourcemap_file'] = options.sourcemap
+      if action in ('simulate', 'both'):
+        kwargs['engine_name'] = options.engine
+        if options.profile or options.flamegraph:
+          if options.engine != 'tree':
+            parser.error('Only the tree engine can be profiled.')
+          from simulator import profiler
+          PROFILER = profiler.Profiler()
+      try:
+        if hasattr(options, 'outputfile') and options.outputfile:
+          actions[action](infile, options.outputfile, **kwargs)
+        else:
+          actions[action](infile, **kwargs)
+      finally:
+        if PROFILER != None:
+          if options.profile:
+            PROFILER.report(sys.stderr)
+          if options.flamegraph:
+            f = open(options.flamegraph, 'w')
+            PROFILER.collapsed(f)
+            f.close()
     else:
       parser.error('Invalid action.')
@@ -0,0 +1,185 @@
+"""
+Compile and run server. Listens on a Unix socket and translates and simulates the programs sent to it, so the interpreter start, the imports and the caches are paid once instead of on every run.py invocation.
+
+Every message is one JSON object on one line. A connection can send any number of requests, each one gets a response:
+
+  request:  {"action" : "translate" | "simulate" | "both", "source" : program source,
+             "name" : file name used in messages (optional), "input" : text read by @ (optional),
+             "engine" : one of run.ENGINES (optional)}
+  response: {"status" : "ok" | "error", "output" : text, "error" : message, "time" : seconds}
+
+The output is what the action writes to its -o file: the PL/0 code for translate, the program output for simulate and both.
+
+USAGE:
+
+$ python run.py serve socket [-e engine] [--cache-dir dir]
+$ python run.py both program.margs --socket socket [--input file]
+"""
+
+import sys
+import os
+import json
+import time
+import socket
+import stat
+import signal
+import hashlib
+import SocketServer
+from collections import OrderedDict
+from cStringIO import StringIO
+
+import run
+
+#actions the server runs
+ACTIONS = ('translate', 'simulate', 'both')
+
+#translated programs and ASTs kept in memory by the server
+MEMO_SIZE = 256
+
+class Server(SocketServer.UnixStreamServer):
+  def __init__(self, path, engine_name = 'tree', inline = None):
+    """
+    The Server initializer. Requests are served one at a time, the engines are CPU bound so threads would not run them any faster.
+    path (string): The socket to listen on.
+    engine_name (string, optional): The engine of the requests which name none (see run.ENGINES).
+    inline (int, optional): The inlining threshold the programs are translated with (see run.INLINE).
+    """
+    SocketServer.UnixStreamServer.__init__(self, path, Handler)
+    self.engine_name = engine_name
+    self.inline = inline
+    self.memo = OrderedDict() #key : (code or AST, SourceMap), least recently used first
+    self.requests = 0 #requests served
+    self.hits = 0 #requests answered from the memo
+
+  def load(self, action, name, source):
+    """
+    Returns (the PL/0 code for translate or the AST for simulate and both, the SourceMap or None) of a source, from the memo when it was seen before.
+    action (string): One of ACTIONS.
+    name (string): The file name used in messages.
+    source (string): The program source.
+    """
+    from simulator import main
+    key = hashlib.sha1(action + '\n' + str(self.inline) + '\n' + name + '\n' + source).hexdigest()
+    if key in self.memo:
+      self.hits += 1
+      value = self.memo.pop(key)
+    elif action == 'translate':
+      value = run.translate_margs(name, source)
+    elif action == 'simulate':
+      value = (main._genAstFromString(source), None)
+    else:
+      value = run.load_margs(name, source)
+    self.memo[key] = value
+    if len(self.memo) > MEMO_SIZE:
+      self.memo.popitem(last = False)
+    return value
+
+  def run(self, request):
+    """
+    Runs one request and returns the response.
+    request (dict): The decoded request.
+    """
+    self.requests += 1
+    response = {'status' : 'ok', 'output' : '', 'error' : '', 'time' : 0.0}
+    action, source = request.get('action'), request.get('source')
+    engine_name = request.get('engine') or self.engine_name
+    if action not in ACTIONS or not isinstance(source, basestring) or engine_name not in run.ENGINES:
+      response['status'], response['error'] = 'error', 'Invalid request.'
+      return response
+    name = (request.get('name') or '<' + action + '>').encode('utf-8')
+
+    begin = time.time()
+    out = StringIO()
+    try:
+      value, smap = self.load(action, name, source.encode('utf-8'))
+      if action == 'translate':
+        out.write(value)
+      else:
+        run.execute(value, out, engine_name, smap, StringIO((request.get('input') or '').encode('utf-8')))
+    except SystemExit, e: #the translator quits on errors
+      response['status'], response['error'] = 'error', str(e.code)
+    except Exception, e:
+      response['status'], response['error'] = 'error', '%s: %s' % (e.__class__.__name__, e)
+    response['output'] = out.getvalue()
+    response['time'] = time.time() - begin
+    return response
+
+class Handler(SocketServer.StreamRequestHandler):
+  def handle(self):
+    """
+    Answers the requests of a connection until the client closes it.
+    """
+    for line in iter(self.rfile.readline, ''):
+      if not line.strip():
+        continue
+      try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+          raise ValueError('a request is a JSON object')
+      except ValueError, e:
+        response = {'status' : 'error', 'output' : '', 'error' : 'ValueError: %s' % e, 'time' : 0.0}
+      else:
+        response = self.server.run(request)
+      self.wfile.write(json.dumps(response) + '\n')
+      self.wfile.flush()
+
+def serve(path, engine_name = 'tree', inline = None, cache = None, cache_ast = False):
+  """
+  Serves requests on a Unix socket until interrupted or terminated.
+  path (string): The socket to listen on. A stale socket left by a server which is gone is replaced.
+  engine_name (string, optional): The engine of the requests which name none (see run.ENGINES).
+  inline (int, optional): The inlining threshold the programs are translated with (see run.INLINE).
+  cache (translator.cache.Cache, optional): The on-disk translation cache (see run.CACHE).
+  cache_ast (bool, optional): Whether the cache also keeps the simulator AST (see run.CACHE_AST).
+  """
+  if os.path.exists(path):
+    if not stat.S_ISSOCK(os.stat(path).st_mode):
+      sys.exit('*** FATAL: ' + path + ' exists and is not a socket')
+    try:
+      connect(path).close()
+    except socket.error:
+      os.remove(path) #nobody listens on it
+    else:
+      sys.exit('*** FATAL: a server is already listening on ' + path)
+  #run.py is running as __main__, so the run module imported here is a second copy which did not see the command line
+  run.INLINE, run.CACHE, run.CACHE_AST = inline, cache, cache_ast
+  run.engine(engine_name) #import the engines up front
+  server = Server(path, engine_name, inline)
+  sys.stderr.write('Serving on ' + path + '\n')
+  signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+    os.remove(path)
+    summary = 'Served %d requests, %d from memory' % (server.requests, server.hits)
+    if cache != None: #the translations which were not in memory went through the cache
+      summary += ', %d of %d translations from the cache' % (cache.hits, cache.hits + cache.misses)
+    sys.stderr.write(summary + '\n')
+
+def connect(path):
+  """
+  Returns a socket connected to a server.
+  path (string): The socket the server listens on.
+  """
+  s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  s.connect(path)
+  return s
+
+def request(path, payload):
+  """
+  Sends one request to a server and returns the response.
+  path (string): The socket the server listens on.
+  payload (dict): The request.
+  """
+  s = connect(path)
+  try:
+    s.sendall(json.dumps(payload) + '\n')
+    line = s.makefile('r').readline()
+  finally:
+    s.close()
+  if not line:
+    raise IOError('the server closed the connection')
+  return json.loads(line)
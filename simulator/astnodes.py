@@ -1,15 +1,23 @@
+## Nodes of the abstract syntax tree built by astgen.
+## Every class lists its fields in __slots__, so a node is a fixed size
+## object without an instance __dict__. The slots set by resolve are
+## listed too. The children list used by prettyPrintTree is only built
+## when it is asked for.
+
 class ASTNode(object):
+    __slots__ = ()
+
     # support subscription
     def __getitem__(self, i):
-        # each instance of the concrete subclasses of ASTNode must provide a
-        # children property to indicate its child nodes in the AST
-        # by this way we can mimic the list representation of the parse tree,
-        # which is the "format" used by the prettyPrintTree function
+        # each concrete subclass of ASTNode computes its child nodes in the
+        # children property, by this way we can mimic the list
+        # representation of the parse tree, which is the "format" used by
+        # the prettyPrintTree function
         return self.children[i]
 
     # support iteration
     def __iter__(self):
-        return self.children
+        return iter(self.children)
 
     def __init__(self):
         raise Exception('Can\'t initialize an abstract class.')
@@ -20,138 +28,192 @@ class ASTNode(object):
     __repr__ = __str__
 
 class Program(ASTNode):
-    block = None
+    __slots__ = ('block',)
     def __init__(self, blk):
         self.block = blk
-        self.children = [ self.__class__.__name__, blk ]
+
+    @property
+    def children(self):
+        return [ self.__class__.__name__, self.block ]
 
 class Block(ASTNode):
-    const_names, const_values = [], []
-    var_names = []
-    procs = []
-    stmt = None
+    __slots__ = ('const_names', 'const_values', 'var_names', 'procs', 'stmt',
+                 'const_slots', 'var_slots')
     def __init__(self, cnames, cvalues, vnames, ps, s):
         self.const_names, self.const_values = cnames, cvalues
         self.var_names = vnames
         self.procs = ps
         self.stmt = s
-        self.children = [ self.__class__.__name__, cnames, cvalues, vnames ]
+
+    @property
+    def children(self):
+        children = [ self.__class__.__name__, self.const_names,
+                     self.const_values, self.var_names ]
         # add procedures to the children list individually, not as a list
-        self.children.extend(ps)
-        self.children.append(s)
+        children.extend(self.procs)
+        children.append(self.stmt)
+        return children
 
 # this is the only ASTNode that doesn't correrspond to one of the
 # non-terminals (or a subclass of a non-terminals) of the grammer.
 class Procedure(ASTNode):
-    name, block = None, None
+    __slots__ = ('name', 'block', 'slot')
     def __init__(self, n, blk):
         self.name, self.block = n, blk
-        self.children = [ self.__class__.__name__, n, blk ]
+
+    @property
+    def children(self):
+        return [ self.__class__.__name__, self.name, self.block ]
 
 class Statement(ASTNode):
+    __slots__ = ()
     def __init__(self):
         raise Exception('Can\'t initialize an abstract class.')
 
 class AssignStatement(Statement):
-    name, expr = None, None
+    __slots__ = ('name', 'expr', 'slot')
     def __init__(self, n, e):
         self.name, self.expr = n, e
-        self.children = [ self.__class__.__name__, n, e ]
+
+    @property
+    def children(self):
+        return [ self.__class__.__name__, self.name, self.expr ]
 
 class CallStatement(Statement):
-    proc_name = None
+    __slots__ = ('proc_name', 'slot')
     def __init__(self, p):
         self.proc_name = p
-        self.children = [ self.__class__.__name__, p ]
+
+    @property
+    def children(self):
+        return [ self.__class__.__name__, self.proc_name ]
 
 class SeqStatement(Statement):
-    stmts = []
+    __slots__ = ('stmts',)
     def __init__(self, sts):
         self.stmts = sts
-        self.children = [ self.__class__.__name__ ]
+
+    @property
+    def children(self):
         # add statements to the children list individually, not as a list
-        self.children.extend(sts)
+        return [ self.__class__.__name__ ] + self.stmts
 
 class IfStatement(Statement):
-    cond, stmt = None, None
+    __slots__ = ('cond', 'stmt')
     def __init__(self, c, st):
         self.cond, self.stmt = c, st
-        self.children = [ self.__class__.__name__, c, st ]
+
+    @property
+    def children(self):
+        return [ self.__class__.__name__, self.cond, self.stmt ]
 
 class WhileStatement(Statement):
-    cond, stmt = None, None
+    __slots__ = ('cond', 'stmt')
     def __init__(self, c, st):
         self.cond, self.stmt = c, st
-        self.children = [ self.__class__.__name__, c, st ]
+
+    @property
+    def children(self):
+        return [ self.__class__.__name__, self.cond, self.stmt ]
 
 class PrintStatement(Statement):
-    expr = None
+    __slots__ = ('expr',)
     def __init__(self, e):
         self.expr = e
-        self.children = [ self.__class__.__name__, e ]
+
+    @property
+    def children(self):
+        return [ self.__class__.__name__, self.expr ]
 
 class InputStatement(Statement):
-    variable = None
+    __slots__ = ('expr', 'slot')
     def __init__(self, e):
-        self.variable = e.terms[0].children[2].name.text
-        self.children = [ self.__class__.__name__, e ]
+        self.expr = e
+
+    # the name of the variable read into, the expression is a single IdFactor
+    @property
+    def variable(self):
+        return self.expr.terms[0].factors[0].name.text
+
+    @property
+    def children(self):
+        return [ self.__class__.__name__, self.expr ]
 
 class Condition(ASTNode):
+    __slots__ = ()
     def __init__(self):
         raise Exception('Can\'t initialize an abstract class.')
 
 class OddCondition(Condition):
-    expr = None
+    __slots__ = ('expr',)
     def __init__(self, e):
         self.expr = e
-        self.children = [ self.__class__.__name__, e ]
+
+    @property
+    def children(self):
+        return [ self.__class__.__name__, self.expr ]
 
 class BinaryCondition(Condition):
-    lhs_expr, rhs_expr = None, None
-    cmp = None
+    __slots__ = ('lhs_expr', 'rhs_expr', 'cmp')
     def __init__(self, lhs, rhs, c):
         self.lhs_expr, self.rhs_expr = lhs, rhs
         self.cmp = c
-        self.children = [ self.__class__.__name__, lhs, rhs, c ]
+
+    @property
+    def children(self):
+        return [ self.__class__.__name__, self.lhs_expr, self.rhs_expr, self.cmp ]
 
 class Expression(ASTNode):
     # len(signs) == len(terms) or
     # len(signs) == len(terms) - 1 must be satisfied
-    signs, terms = [], []
+    __slots__ = ('signs', 'terms')
     def __init__(self, s, t):
         self.signs, self.terms = s, t
-        self.children = [ self.__class__.__name__, s ]
+
+    @property
+    def children(self):
         # add terms to the children list individually, not as a list
-        self.children.extend(t)
+        return [ self.__class__.__name__, self.signs ] + self.terms
 
 class Term(ASTNode):
     # len(signs) == len(terms) - 1 must be satisfied
-    signs, factors = [], []
+    __slots__ = ('signs', 'factors')
     def __init__(self, s, f):
         self.signs, self.factors = s, f
-        self.children = [ self.__class__.__name__, s ]
+
+    @property
+    def children(self):
         # add factors to the children list individually, not as a list
-        self.children.extend(f)
+        return [ self.__class__.__name__, self.signs ] + self.factors
 
 class Factor(ASTNode):
+    __slots__ = ()
     def __init__(self):
         raise Exception('Can\'t initialize an abstract class.')
 
 class IdFactor(Factor):
-    name = None
+    __slots__ = ('name', 'slot')
     def __init__(self, n):
         self.name = n
-        self.children = [ self.__class__.__name__, n ]
+
+    @property
+    def children(self):
+        return [ self.__class__.__name__, self.name ]
 
 class NumFactor(Factor):
-    number = None
+    __slots__ = ('number',)
     def __init__(self, n):
         self.number = n
-        self.children = [ self.__class__.__name__, n ]
+
+    @property
+    def children(self):
+        return [ self.__class__.__name__, self.number ]
 
 class ExprFactor(Factor):
-    expr = None
+    __slots__ = ('expr',)
     def __init__(self, e):
         self.expr = e
-        self.children = [ self.__class__.__name__, e ]
 
+    @property
+    def children(self):
+        return [ self.__class__.__name__, self.expr ]
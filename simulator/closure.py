@@ -0,0 +1,233 @@
+## A closure compiling engine for the AST.
+## compileAbstractType turns every node into a Python closure in a single
+## walk, so running the program never dispatches on node class names.
+## The symbol tables, evaluation order and runtime errors are the same as
+## in interp. The closures are bound to the tables and streams of the
+## Interpreter that compiled them.
+
+import resolve
+import streams
+
+class Interpreter(streams.Streams):
+    def __init__(self, stdin=None, stdout=None):
+        streams.Streams.__init__(self, stdin, stdout)
+        ## the symbol table, indexed by the slots assigned by resolve
+        # slot : number, None until the const is defined
+        self.consts = []
+        # slot : number, None until the variable is assigned
+        self.values = []
+        # slot : whether the variable has been declared
+        self.declared = []
+        # procedure slot : closure running the procedure block
+        self.procs = []
+
+    def run(self, node):
+        symbols = resolve.resolve(node)
+        # filled in place, the closures hold on to the lists
+        self.consts[:] = [None] * len(symbols.names)
+        self.values[:] = [None] * len(symbols.names)
+        self.declared[:] = [False] * len(symbols.names)
+        self.procs[:] = [None] * len(symbols.procs)
+        self.compileAbstractType(node)()
+
+    def compileProgram(self, node):
+        return self.compileBlock(node.block)
+
+    def compileBlock(self, node):
+        consts, values, declared = self.consts, self.values, self.declared
+        defs = [(k.text, k.linenum, i, int(v.text))
+                for k, v, i in zip(node.const_names, node.const_values,
+                                   node.const_slots)]
+        slots = node.var_slots
+        decls = map(self.compileProcedure, node.procs)
+        stmt = node.stmt and self.compileAbstractType(node.stmt)
+        def block():
+            for name, linenum, i, value in defs:
+                if consts[i] is not None:
+                    raise Exception('Const %s cannot be redefined at line %d.'
+                            % (name, linenum))
+                consts[i] = value
+            for i in slots:
+                values[i] = None
+                declared[i] = True
+            for decl in decls:
+                decl()
+            if stmt:
+                stmt()
+        return block
+
+    def compileProcedure(self, node):
+        procs = self.procs
+        name, linenum, i = node.name.text, node.name.linenum, node.slot
+        body = self.compileBlock(node.block)
+        def procedure():
+            if procs[i] is not None:
+                raise Exception('Procedure %s cannot be redeclared at line %d.'
+                        % (name, linenum))
+            procs[i] = body
+        return procedure
+
+    def compileAssignStatement(self, node):
+        values, declared = self.values, self.declared
+        name, linenum, i = node.name.text, node.name.linenum, node.slot
+        expr = self.compileExpression(node.expr)
+        def assign():
+            if not declared[i]:
+                raise Exception('Variable %s assigned before declaration at line %d.'
+                        % (name, linenum))
+            values[i] = expr()
+        return assign
+
+    def compileCallStatement(self, node):
+        procs = self.procs
+        name, linenum, i = node.proc_name.text, node.proc_name.linenum, node.slot
+        def call():
+            if procs[i] is None:
+                raise Exception('Procedure %s undefined at line %d.'
+                        % (name, linenum))
+            procs[i]()
+        return call
+
+    def compileSeqStatement(self, node):
+        stmts = map(self.compileAbstractType, node.stmts)
+        def seq():
+            for stmt in stmts:
+                stmt()
+        return seq
+
+    def compileIfStatement(self, node):
+        cond = self.compileAbstractType(node.cond)
+        stmt = self.compileAbstractType(node.stmt)
+        def if_():
+            if cond():
+                stmt()
+        return if_
+
+    def compileWhileStatement(self, node):
+        cond = self.compileAbstractType(node.cond)
+        stmt = self.compileAbstractType(node.stmt)
+        def while_():
+            while cond():
+                stmt()
+        return while_
+
+    def compilePrintStatement(self, node):
+        write = self.write
+        expr = self.compileExpression(node.expr)
+        def print_():
+            write(expr())
+        return print_
+
+    def compileInputStatement(self, node):
+        values, declared, read = self.values, self.declared, self.read
+        name, i = node.variable, node.slot
+        def input_():
+            values[i] = read(name)
+            declared[i] = True
+        return input_
+
+    def compileOddCondition(self, node):
+        return self.compileExpression(node.expr)
+
+    def compileBinaryCondition(self, node):
+        l = self.compileExpression(node.lhs_expr)
+        r = self.compileExpression(node.rhs_expr)
+        cmp = node.cmp.text
+        if cmp == '<=':
+            return lambda: l() <= r()
+        elif cmp == '>=':
+            return lambda: l() >= r()
+        elif cmp == '<':
+            return lambda: l() < r()
+        elif cmp == '>':
+            return lambda: l() > r()
+        elif cmp == '=':
+            return lambda: l() == r()
+        elif cmp == '#':
+            return lambda: not l() == r()
+        def unknown():
+            # same failure as interp's lookup, once both sides are evaluated
+            l(), r()
+            raise KeyError(cmp)
+        return unknown
+
+    def compileExpression(self, node):
+        signs, terms = node.signs, map(self.compileTerm, node.terms)
+        # like interp a leading sign is accepted but does not change the value
+        if len(signs) == len(terms):
+            signs = signs[1:]
+        first, rest = terms[0], zip([s.text for s in signs], terms[1:])
+        if not rest:
+            return first
+        if len(rest) == 1:
+            s, t = rest[0]
+            if s == '+':
+                return lambda: first() + t()
+            elif s == '-':
+                return lambda: first() - t()
+        def expression():
+            accum = first()
+            for s, t in rest:
+                if s == '+':
+                    accum += t()
+                elif s == '-':
+                    accum -= t()
+            return accum
+        return expression
+
+    def compileTerm(self, node):
+        signs, factors = node.signs, map(self.compileAbstractType, node.factors)
+        first, rest = factors[0], zip([s.text for s in signs], factors[1:])
+        if not rest:
+            return first
+        if len(rest) == 1:
+            s, f = rest[0]
+            if s == '*':
+                return lambda: first() * f()
+            elif s == '/':
+                return lambda: first() / f()
+        def term():
+            accum = first()
+            for s, f in rest:
+                if s == '*':
+                    accum *= f()
+                elif s == '/':
+                    accum /= f()
+            return accum
+        return term
+
+    def compileIdFactor(self, node):
+        consts, values, declared = self.consts, self.values, self.declared
+        name, linenum, i = node.name.text, node.name.linenum, node.slot
+        def idfactor():
+            value = consts[i]
+            if value is not None:
+                return value
+            value = values[i]
+            # None means never assigned, or never declared at all
+            if value is None:
+                if declared[i]:
+                    raise Exception('Variable %s used before initialized at line %d.'
+                            % (name, linenum))
+                raise Exception('Identifier %s not found at line %d.'
+                        % (name, linenum))
+            return value
+        return idfactor
+
+    def compileNumFactor(self, node):
+        value = int(node.number.text)
+        return lambda: value
+
+    def compileExprFactor(self, node):
+        return self.compileExpression(node.expr)
+
+    def compileAbstractType(self, node):
+        return _compilers[node.__class__.__name__](self, node)
+
+# node class name : method compiling it
+_compilers = dict((name[len('compile'):], f)
+                  for name, f in Interpreter.__dict__.items()
+                  if name.startswith('compile') and name != 'compileAbstractType')
+
+def interpret(node):
+    Interpreter().run(node)
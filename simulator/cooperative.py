@@ -0,0 +1,134 @@
+## Cooperative execution of many programs in one thread.
+## A Task runs a program with vm.Interpreter.steps(), which gives control
+## back after a quantum of loop iterations and procedure calls and while
+## an @ waits for a line that has not arrived. A Scheduler gives its tasks
+## turns round robin and skips the ones waiting for input, so thousands of
+## programs can run at once without a thread each. Input and output go
+## through Pipes: the embedding code writes the lines the programs read
+## and drains what they print between turns.
+
+import time
+from collections import deque
+
+import vm
+
+# loop iterations and procedure calls in one turn of a task
+QUANTUM = 1000
+
+class Pipe(object):
+    """An in-memory stream written on one end and read on the other.
+    Reading never blocks, ready() tells whether a whole line, or the end
+    of the stream once it is closed, can be read."""
+    def __init__(self):
+        # text written and not read yet, the first chunk from offset on
+        self.chunks = deque()
+        self.offset = 0
+        # newlines in the chunks, so ready() does not look at the text
+        self.lines = 0
+        self.closed = False
+
+    def write(self, text):
+        if self.closed:
+            raise ValueError('I/O operation on closed pipe')
+        if text:
+            self.chunks.append(text)
+            self.lines += text.count('\n')
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def ready(self):
+        return self.closed or self.lines > 0
+
+    def readline(self):
+        """Returns the next line, '' at the end of the stream and while
+        no whole line has been written. Only the chunks of the line are
+        copied."""
+        if not self.lines and not self.closed:
+            return ''
+        parts = []
+        while self.chunks:
+            chunk = self.chunks[0]
+            end = chunk.find('\n', self.offset) + 1
+            if end:
+                parts.append(chunk[self.offset:end])
+                self.lines -= 1
+                if end == len(chunk):
+                    self.chunks.popleft()
+                    self.offset = 0
+                else:
+                    self.offset = end
+                break
+            parts.append(chunk[self.offset:])
+            self.chunks.popleft()
+            self.offset = 0
+        return ''.join(parts)
+
+    def read(self):
+        """Returns everything written so far."""
+        if self.chunks:
+            self.chunks[0] = self.chunks[0][self.offset:]
+        text = ''.join(self.chunks)
+        self.chunks.clear()
+        self.offset, self.lines = 0, 0
+        return text
+
+class Task(vm.Interpreter):
+    def __init__(self, node, stdin=None, stdout=None, quantum=QUANTUM):
+        """Assembles a Program to run with a Scheduler. The streams
+        default to new Pipes."""
+        vm.Interpreter.__init__(self, stdin or Pipe(), stdout or Pipe())
+        self._steps = self.steps(vm.assemble(node), quantum)
+        # waiting for input at the end of the last turn
+        self.waiting = False
+        self.done = False
+        # exception which ended the program
+        self.error = None
+        # seconds spent running and number of turns
+        self.time, self.turns = 0.0, 0
+
+    def runnable(self):
+        return not self.done and (not self.waiting or self.ready())
+
+    def step(self):
+        """Runs the program for one turn, returns whether it is not done."""
+        start = time.time()
+        try:
+            self.waiting = self._steps.next()
+        except StopIteration:
+            self.done = True
+        except Exception, e:
+            self.done, self.error = True, e
+        self.time += time.time() - start
+        self.turns += 1
+        return not self.done
+
+class Scheduler(object):
+    def __init__(self):
+        # tasks which are not done, in the order they take turns
+        self.tasks = []
+
+    def add(self, task):
+        self.tasks.append(task)
+        return task
+
+    def step(self):
+        """Gives one turn to every task which can run and drops the tasks
+        which are done. Returns whether any task ran."""
+        ran = False
+        for task in self.tasks:
+            if task.runnable():
+                task.step()
+                ran = True
+        self.tasks = [task for task in self.tasks if not task.done]
+        return ran
+
+    def run(self):
+        """Runs until every task is done or waits for input. Returns the
+        tasks still waiting."""
+        while self.tasks and self.step():
+            pass
+        return self.tasks
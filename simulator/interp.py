@@ -1,140 +1,151 @@
-## the symbol table
-# string : number
-const_dict = {}
-# string : number
-var_dict = {}
-# string : Block(ASTNode)
-proc_dict = {}
-
-def interpret(node):
-    map(dict.clear, (const_dict, var_dict, proc_dict))
-    interpretProgram(node)
-
-def interpretProgram(node):
-    interpretBlock(node.block)
-
-def interpretBlock(node):
-    for k, v in zip(node.const_names, node.const_values):
-        if const_dict.has_key(k.text):
-            raise Exception('Const %s cannot be redefined at line %d.'
-                    % (k.text, k.linenum))
-        else:
-            const_dict[k.text] = int(v.text)
-    for k in node.var_names:
-      var_dict[k.text] = None
-      """"
-        if var_dict.has_key(k.text):
-            raise Exception('Variable %s cannot be redeclared at line %d.'
-                    % (k.text, k.linenum))
+import resolve
+import streams
+
+class Interpreter(streams.Streams):
+    """Walks the AST of a program. Every instance owns its symbol tables
+    and streams, so any number of them can run at once."""
+    def __init__(self, stdin=None, stdout=None):
+        streams.Streams.__init__(self, stdin, stdout)
+        ## the symbol table, indexed by the slots assigned by resolve
+        # slot : number, None until the const is defined
+        self.consts = []
+        # slot : number, None until the variable is assigned
+        self.values = []
+        # slot : whether the variable has been declared
+        self.declared = []
+        # procedure slot : Block(ASTNode), None until the procedure is declared
+        self.procs = []
+
+    def run(self, node):
+        symbols = resolve.resolve(node)
+        self.consts[:] = [None] * len(symbols.names)
+        self.values[:] = [None] * len(symbols.names)
+        self.declared[:] = [False] * len(symbols.names)
+        self.procs[:] = [None] * len(symbols.procs)
+        self.interpretProgram(node)
+
+    def interpretProgram(self, node):
+        self.interpretBlock(node.block)
+
+    def interpretBlock(self, node):
+        consts, values, declared = self.consts, self.values, self.declared
+        for k, v, i in zip(node.const_names, node.const_values, node.const_slots):
+            if consts[i] is not None:
+                raise Exception('Const %s cannot be redefined at line %d.'
+                        % (k.text, k.linenum))
+            else:
+                consts[i] = int(v.text)
+        for i in node.var_slots:
+            values[i] = None
+            declared[i] = True
+        map(self.interpretProcedure, node.procs)
+        if node.stmt:
+            self.interpretAbstractType(node.stmt)
+
+    def interpretProcedure(self, node):
+        if self.procs[node.slot] is not None:
+            raise Exception('Procedure %s cannot be redeclared at line %d.'
+                    % (node.name.text, node.name.linenum))
         else:
-            var_dict[k.text] = None
-      """
-    map(interpretProcedure, node.procs)
-    if node.stmt:
-        interpretAbstractType(node.stmt)
-
-def interpretProcedure(node):
-    if proc_dict.has_key(node.name.text):
-        raise Exception('Procedure %s cannot be redeclared at line %d.'
-                % (node.name.text, node.name.linenum))
-    else:
-        proc_dict[node.name.text] = node.block
+            self.procs[node.slot] = node.block
 
-def interpretAssignStatement(node):
-    if not var_dict.has_key(node.name.text):
-        raise Exception('Variable %s assigned before declaration at line %d.'
-                % (node.name.text, node.name.linenum))
-    else:
-        var_dict[node.name.text] = interpretExpression(node.expr)
-
-def interpretCallStatement(node):
-    if not proc_dict.has_key(node.proc_name.text):
-        raise Exception('Procedure %s undefined at line %d.'
-                % (node.proc_name.text, node.proc_name.linenum))
-    else:
-        interpretBlock(proc_dict[node.proc_name.text])
-
-def interpretSeqStatement(node):
-    map(interpretAbstractType, node.stmts)
-
-def interpretIfStatement(node):
-    if interpretAbstractType(node.cond):
-        interpretAbstractType(node.stmt)
-
-def interpretWhileStatement(node):
-    while interpretAbstractType(node.cond):
-        interpretAbstractType(node.stmt)
-
-def interpretPrintStatement(node):
-    import sys
-    sys.stdout.write(str(interpretExpression(node.expr)) + '\n')
-
-def interpretInputStatement(node):
-    var_dict[node.variable] = int(raw_input('INPUT ' + str(node.variable) + ': '))
-
-def interpretOddCondition(node):
-    return interpretExpression(node.expr)
-
-def interpretBinaryCondition(node):
-    l = interpretExpression(node.lhs_expr)
-    r = interpretExpression(node.rhs_expr)
-    cmp = node.cmp.text
-    return {'<=': l <= r,
-            '>=': l >= r,
-            '<': l < r,
-            '>': l > r,
-            '=': l == r,
-            '#': not l == r }[cmp]
-
-def interpretExpression(node):
-    signs, terms = node.signs, node.terms
-    if len(signs) == len(terms) - 1:
-        firstsign = 1
-    elif len(signs) == len(terms):
-        firstsign = -1 if signs[0] == '-' else 1
-        signs = signs[1:]
-    accum = firstsign * interpretTerm(terms[0])
-    terms = terms[1:]
-    for s, t in zip(signs, terms):
-        if s.text == '+':
-            accum += interpretTerm(t)
-        elif s.text == '-':
-            accum -= interpretTerm(t)
-    return accum
-
-def interpretTerm(node):
-    signs, factors = node.signs, node.factors
-    accum = interpretAbstractType(factors[0])
-    factors = factors[1:]
-    for s, f in zip(signs, factors):
-        if s.text == '*':
-            accum *= interpretAbstractType(f)
-        elif s.text == '/':
-            accum /= interpretAbstractType(f)
-    return accum
-
-def interpretIdFactor(node):
-    n = node.name.text
-    if const_dict.has_key(n):
-        return const_dict[n]
-    if var_dict.has_key(n):
-        # have to compare with None here since it can be 0
-        # if we provide a null value in PL/0 we need to distinguish
-        # "uninitialized" and "null" from implementation perspective
-        if var_dict[n] == None:
-            raise Exception('Variable %s used before initialized at line %d.'
+    def interpretAssignStatement(self, node):
+        if not self.declared[node.slot]:
+            raise Exception('Variable %s assigned before declaration at line %d.'
                     % (node.name.text, node.name.linenum))
         else:
-            return var_dict[n]
-    raise Exception('Identifier %s not found at line %d.'
-            % (node.name.text, node.name.linenum))
+            self.values[node.slot] = self.interpretExpression(node.expr)
+
+    def interpretCallStatement(self, node):
+        if self.procs[node.slot] is None:
+            raise Exception('Procedure %s undefined at line %d.'
+                    % (node.proc_name.text, node.proc_name.linenum))
+        else:
+            self.interpretBlock(self.procs[node.slot])
+
+    def interpretSeqStatement(self, node):
+        map(self.interpretAbstractType, node.stmts)
+
+    def interpretIfStatement(self, node):
+        if self.interpretAbstractType(node.cond):
+            self.interpretAbstractType(node.stmt)
+
+    def interpretWhileStatement(self, node):
+        while self.interpretAbstractType(node.cond):
+            self.interpretAbstractType(node.stmt)
+
+    def interpretPrintStatement(self, node):
+        self.write(self.interpretExpression(node.expr))
+
+    def interpretInputStatement(self, node):
+        self.values[node.slot] = self.read(node.variable)
+        self.declared[node.slot] = True
+
+    def interpretOddCondition(self, node):
+        return self.interpretExpression(node.expr)
+
+    def interpretBinaryCondition(self, node):
+        l = self.interpretExpression(node.lhs_expr)
+        r = self.interpretExpression(node.rhs_expr)
+        cmp = node.cmp.text
+        return {'<=': l <= r,
+                '>=': l >= r,
+                '<': l < r,
+                '>': l > r,
+                '=': l == r,
+                '#': not l == r }[cmp]
+
+    def interpretExpression(self, node):
+        signs, terms = node.signs, node.terms
+        if len(signs) == len(terms) - 1:
+            firstsign = 1
+        elif len(signs) == len(terms):
+            firstsign = -1 if signs[0] == '-' else 1
+            signs = signs[1:]
+        accum = firstsign * self.interpretTerm(terms[0])
+        terms = terms[1:]
+        for s, t in zip(signs, terms):
+            if s.text == '+':
+                accum += self.interpretTerm(t)
+            elif s.text == '-':
+                accum -= self.interpretTerm(t)
+        return accum
+
+    def interpretTerm(self, node):
+        signs, factors = node.signs, node.factors
+        accum = self.interpretAbstractType(factors[0])
+        factors = factors[1:]
+        for s, f in zip(signs, factors):
+            if s.text == '*':
+                accum *= self.interpretAbstractType(f)
+            elif s.text == '/':
+                accum /= self.interpretAbstractType(f)
+        return accum
+
+    def interpretIdFactor(self, node):
+        i = node.slot
+        if self.consts[i] is not None:
+            return self.consts[i]
+        if self.declared[i]:
+            # have to compare with None here since it can be 0
+            # if we provide a null value in PL/0 we need to distinguish
+            # "uninitialized" and "null" from implementation perspective
+            if self.values[i] == None:
+                raise Exception('Variable %s used before initialized at line %d.'
+                        % (node.name.text, node.name.linenum))
+            else:
+                return self.values[i]
+        raise Exception('Identifier %s not found at line %d.'
+                % (node.name.text, node.name.linenum))
 
-def interpretNumFactor(node):
-    return int(node.number.text)
+    def interpretNumFactor(self, node):
+        return int(node.number.text)
 
-def interpretExprFactor(node):
-    return interpretExpression(node.expr)
+    def interpretExprFactor(self, node):
+        return self.interpretExpression(node.expr)
 
-def interpretAbstractType(node):
-    return apply(eval('interpret' + node.__class__.__name__), (node, ))
+    def interpretAbstractType(self, node):
+        return getattr(self, 'interpret' + node.__class__.__name__)(node)
 
+def interpret(node):
+    Interpreter().run(node)
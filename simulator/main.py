@@ -12,6 +12,11 @@ def _parseFile(infile):
     f.close()
     return parsetree
 
+def _parseString(source):
+    import parser
+    from cStringIO import StringIO
+    return parser.parse(StringIO(source))
+
 def printParseTreeFromFile(infile):
     import utils
     utils.prettyPrintTree(_parseFile(infile))
@@ -21,6 +26,10 @@ def _genAstFromFile(infile):
     ast = astgen.traverse(_parseFile(infile))
     return ast
 
+def _genAstFromString(source):
+    import astgen
+    return astgen.traverse(_parseString(source))
+
 def printAstFromFile(infile):
     import utils
     utils.prettyPrintTree(_genAstFromFile(infile))
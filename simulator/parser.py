@@ -1,8 +1,15 @@
+import threading
+
+# the scanner keeps its position in module globals, so only one thread
+# parses at a time
+_lock = threading.Lock()
+
 ## PARSER
 # A recursive descent parser - almost a direct translation of the grammer.
 def parse(f):
-    _init(f)
-    return program()
+    with _lock:
+        _init(f)
+        return program()
 
 def program():
     return '<PROGRAM>', block(), _expect(Token.DOT), _expect(Token.EOF)
@@ -195,5 +202,5 @@ def _init(f):
     # these 3 are what we need from our scanner
     Token, nexttoken = scanner.Token, scanner.nexttoken
     # we only need lookahead(1) for PL/0 grammer
-    lk1 = lambda : scanner.lookahead()[0]
+    lk1 = scanner.peek
 
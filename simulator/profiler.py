@@ -0,0 +1,186 @@
+## An opt-in profiler for the interp engine.
+## Profiler.run() shadows the interpret* methods of an interp.Interpreter
+## with wrappers that count executions and time them, then runs the
+## program. Only that instance is changed, so there is no cost at all
+## when profiling is off.
+##
+## Times are wall clock seconds. Every node gets its total (inclusive) and
+## self (exclusive) time, self time is also summed per source line, per
+## procedure and per call stack. The call stacks can be written in the
+## collapsed format read by flamegraph.pl and speedscope. When linemap is
+## set (a function describing a PL/0 line, such as the describe() of a
+## translator source map) the report groups the lines by what it returns.
+
+import sys
+import time
+
+import interp
+
+# the dispatcher is not wrapped, it would only count the time of the
+# nodes it runs a second time
+_skipped = ('interpretAbstractType', )
+
+# name of the main program in the call stacks
+MAIN = 'main'
+
+class Profiler(object):
+    def __init__(self):
+        # (node class, line) : [count, total, self]
+        self.nodes = {}
+        # line : [count, self]
+        self.lines = {}
+        # procedure name : [calls, total, self]
+        self.procs = {MAIN: [1, 0.0, 0.0]}
+        # 'main;p;q' : self
+        self.stacks = {}
+        self.total = 0.0
+        # id(node) : line, filled on first execution
+        self._nodelines = {}
+        # child time accumulated by each running wrapper
+        self._frames = []
+        self._callstack = [MAIN]
+        self._stackkey = MAIN
+        # PL/0 line : description of the origin of the line, or None
+        self.linemap = None
+
+    def run(self, node, stdin=None, stdout=None):
+        """Runs a Program with interp while collecting the profile."""
+        interpreter = interp.Interpreter(stdin, stdout)
+        for name in dir(interpreter):
+            if name.startswith('interpret') and name not in _skipped:
+                f = getattr(interpreter, name)
+                if name == 'interpretCallStatement':
+                    wrapper = self._wrapcall(f)
+                else:
+                    wrapper = self._wrap(f)
+                setattr(interpreter, name, wrapper)
+        start = time.time()
+        try:
+            interpreter.run(node)
+        finally:
+            self.total += time.time() - start
+            self.procs[MAIN][1] = self.total
+
+    def _wrap(self, f):
+        frames, clock = self._frames, time.time
+        def profiled(node):
+            frames.append(0.0)
+            start = clock()
+            try:
+                return f(node)
+            finally:
+                elapsed = clock() - start
+                own = elapsed - frames.pop()
+                if frames:
+                    frames[-1] += elapsed
+                self._record(node, elapsed, own)
+        return profiled
+
+    def _wrapcall(self, f):
+        profiled = self._wrap(f)
+        def call(node):
+            name = node.proc_name.text
+            stats = self.procs.setdefault(name, [0, 0.0, 0.0])
+            self._callstack.append(name)
+            outer, self._stackkey = self._stackkey, self._stackkey + ';' + name
+            start = time.time()
+            try:
+                return profiled(node)
+            finally:
+                stats[0] += 1
+                stats[1] += time.time() - start
+                self._callstack.pop()
+                self._stackkey = outer
+        return call
+
+    def _record(self, node, elapsed, own):
+        line = self._line(node)
+        key = (node.__class__.__name__, line)
+        stats = self.nodes.get(key)
+        if stats is None:
+            stats = self.nodes[key] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] += own
+        stats = self.lines.get(line)
+        if stats is None:
+            stats = self.lines[line] = [0, 0.0]
+        stats[0] += 1
+        stats[1] += own
+        # the call statement itself still belongs to its caller
+        if node.__class__.__name__ == 'CallStatement':
+            proc, stack = self._callstack[-2], self._stackkey.rsplit(';', 1)[0]
+        else:
+            proc, stack = self._callstack[-1], self._stackkey
+        self.procs[proc][2] += own
+        self.stacks[stack] = self.stacks.get(stack, 0.0) + own
+
+    def _line(self, node):
+        i = id(node)
+        if i not in self._nodelines:
+            self._nodelines[i] = _firstline(node)
+        return self._nodelines[i]
+
+    def report(self, out=None, limit=20):
+        """Writes the hot spots, sorted by self time."""
+        out = out or sys.stderr
+        total = self.total or 1.0
+        out.write('PROFILE %.6fs\n' % self.total)
+        out.write('\nProcedures\n')
+        out.write('%10s %12s %12s %7s  %s\n' % ('calls', 'total(s)', 'self(s)', 'self%', 'name'))
+        for name, (calls, inclusive, own) in _sorted(self.procs, 2)[:limit]:
+            out.write('%10d %12.6f %12.6f %6.1f%%  %s\n'
+                      % (calls, inclusive, own, 100 * own / total, name))
+        out.write('\nLines\n')
+        out.write('%10s %12s %7s  %s\n' % ('count', 'self(s)', 'self%', 'line'))
+        for line, (count, own) in _sorted(self._groupedlines(), 1)[:limit]:
+            out.write('%10d %12.6f %6.1f%%  %s\n'
+                      % (count, own, 100 * own / total, line))
+        out.write('\nNodes\n')
+        out.write('%10s %12s %12s %7s  %s\n' % ('count', 'total(s)', 'self(s)', 'self%', 'node'))
+        for (kind, line), (count, inclusive, own) in _sorted(self.nodes, 2)[:limit]:
+            out.write('%10d %12.6f %12.6f %6.1f%%  %s at %s\n'
+                      % (count, inclusive, own, 100 * own / total, kind,
+                         self._describe(line)))
+
+    def _describe(self, line):
+        origin = self.linemap and self.linemap(line)
+        if origin:
+            return 'line %d (%s)' % (line, origin)
+        return 'line %d' % line
+
+    def _groupedlines(self):
+        if not self.linemap:
+            return dict([(str(line), stats) for line, stats in self.lines.items()])
+        groups = {}
+        for line, (count, own) in self.lines.items():
+            key = self.linemap(line) or 'PL/0 line %d' % line
+            stats = groups.setdefault(key, [0, 0.0])
+            stats[0] += count
+            stats[1] += own
+        return groups
+
+    def collapsed(self, out):
+        """Writes the call stacks in the collapsed stack format, one
+        'main;p;q microseconds' line per stack."""
+        for stack, own in sorted(self.stacks.items()):
+            micros = int(round(own * 1e6))
+            if micros > 0:
+                out.write('%s %d\n' % (stack, micros))
+
+def _sorted(table, column):
+    return sorted(table.items(), key=lambda item: item[1][column], reverse=True)
+
+def _firstline(obj):
+    """Returns the line of the first token below an AST node, 0 if none."""
+    if hasattr(obj, 'linenum'):
+        return obj.linenum
+    if isinstance(obj, list):
+        children = obj
+    else:
+        children = getattr(obj, 'children', None) or []
+    for child in children:
+        line = _firstline(child)
+        if line:
+            return line
+    return 0
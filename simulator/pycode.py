@@ -0,0 +1,270 @@
+## Compiles the AST to Python source code.
+## generate() turns every Procedure into a Python function and every
+## identifier into a slot of a flat list, the result is compile()d once
+## and run by CPython instead of walking the tree. Code objects are cached
+## by the SHA-1 of the generated code, so running the same program again
+## skips the compile(), the code generation itself runs every time.
+## Programs nested deeper than the CPython parser and compiler allow (20
+## nested loops, 100 levels of indentation) are run by closure instead.
+##
+## Identifiers follow interp: one global slot per name (assigned by
+## resolve), constants take
+## priority over variables, VAR resets a variable on each block entry and
+## procedures are registered on block entry. Names only declared in the
+## main block are known to exist once it starts, their accesses are
+## generated without any checks. The output and runtime errors are the
+## same as interp's, but deep recursion is still limited by Python's stack.
+## Code objects hold no state, every run gets fresh tables in the globals
+## of its exec and the streams of its Interpreter.
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import closure
+import resolve
+import streams
+
+# code objects kept in _cache
+CACHE_SIZE = 256
+
+# sha1 hex digest : code object, or None when CPython cannot compile the
+# program, least recently used first
+_cache = OrderedDict()
+# interpreters run in parallel threads share _cache
+_lock = threading.Lock()
+
+class Interpreter(streams.Streams):
+    def run(self, node):
+        code = _compile(generate(node))
+        if code is None:
+            closure.Interpreter(self.stdin, self.stdout).run(node)
+        else:
+            self.execute(code)
+
+    def execute(self, code):
+        exec code in {'_write': self.write, '_read': self.read}
+
+def interpret(node):
+    Interpreter().run(node)
+
+def _compile(pysource):
+    def make():
+        try:
+            return compile(pysource, '<pl0>', 'exec')
+        except (SyntaxError, MemoryError):
+            # too many nested blocks, indentation levels or parentheses
+            return None
+    return _cached('py:' + hashlib.sha1(pysource).hexdigest(), make)
+
+def _cached(key, make):
+    """Returns the code object of a key, made by make() on a miss. Two
+    threads missing the same key both make it, the last one is kept."""
+    with _lock:
+        if key in _cache:
+            code = _cache.pop(key)
+            _cache[key] = code
+            return code
+    code = make()
+    with _lock:
+        _cache.pop(key, None)
+        _cache[key] = code
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return code
+
+def execute(code):
+    Interpreter().execute(code)
+
+## CODE GENERATION
+def generate(node):
+    """Returns the Python source code of a Program."""
+    return _Generator(node).source
+
+class _Generator(object):
+    def __init__(self, program):
+        self.symbols = resolve.resolve(program)
+        self.slots = self.symbols.nameslots
+        # id(Procedure) : name of the generated function
+        self.fnames = {}
+        self.functions = []
+        self.lines = []
+        # names declared in blocks other than the main one
+        top = program.block
+        self.topconsts, self.topvars, self.topprocs = {}, set(), {}
+        self.otherconsts, self.othervars, self.otherprocs = set(), set(), set()
+        self._collect(top, True)
+        procs = self._functions(top)
+        self._line(0, 'def main(V=V, D=D):')
+        self._block(top, 1, procs, True)
+        body = self.lines
+        self.lines = []
+        self._prelude()
+        self.lines.extend(body)
+        for f in self.functions:
+            self.lines.extend(f)
+        self._line(0, 'main()')
+        self.source = '\n'.join(self.lines) + '\n'
+
+    def _collect(self, block, top):
+        for k, v in zip(block.const_names, block.const_values):
+            if top and k.text not in self.topconsts:
+                self.topconsts[k.text] = int(v.text)
+            else:
+                self.otherconsts.add(k.text)
+        for k in block.var_names:
+            if top:
+                self.topvars.add(k.text)
+            else:
+                self.othervars.add(k.text)
+        for p in block.procs:
+            fname = 'p%d_%s' % (len(self.fnames), p.name.text)
+            self.fnames[id(p)] = fname
+            if top and p.name.text not in self.topprocs:
+                self.topprocs[p.name.text] = fname
+            else:
+                self.otherprocs.add(p.name.text)
+            self._collect(p.block, False)
+
+    def _line(self, depth, text):
+        self.lines.append('    ' * depth + text)
+
+    def _prelude(self):
+        n = len(self.symbols.names)
+        self._line(0, 'V = [None] * %d' % n)
+        self._line(0, 'D = [False] * %d' % n)
+        self._line(0, 'C = [None] * %d' % n)
+        self._line(0, 'P = [None] * %d' % len(self.symbols.procs))
+        self._line(0, 'NAMES = %r' % (self.symbols.names, ))
+        self._line(0, 'PNAMES = %r' % (self.symbols.procs, ))
+        self._line(0, 'def _load(i, line):')
+        self._line(1, 'if C[i] is not None: return C[i]')
+        self._line(1, 'if V[i] is not None: return V[i]')
+        self._line(1, 'return _unset(i, line)')
+        self._line(0, 'def _unset(i, line):')
+        self._line(1, 'if D[i]: raise Exception(\'Variable %s used before initialized at line %d.\' % (NAMES[i], line))')
+        self._line(1, 'raise Exception(\'Identifier %s not found at line %d.\' % (NAMES[i], line))')
+        self._line(0, 'def _undeclared(i, line):')
+        self._line(1, 'raise Exception(\'Variable %s assigned before declaration at line %d.\' % (NAMES[i], line))')
+        self._line(0, 'def _defconst(i, value, line):')
+        self._line(1, 'if C[i] is not None: raise Exception(\'Const %s cannot be redefined at line %d.\' % (NAMES[i], line))')
+        self._line(1, 'C[i] = value')
+        self._line(0, 'def _defproc(i, f, line):')
+        self._line(1, 'if P[i] is not None: raise Exception(\'Procedure %s cannot be redeclared at line %d.\' % (PNAMES[i], line))')
+        self._line(1, 'P[i] = f')
+        self._line(0, 'def _call(i, line):')
+        self._line(1, 'if P[i] is None: raise Exception(\'Procedure %s undefined at line %d.\' % (PNAMES[i], line))')
+        self._line(1, 'P[i]()')
+
+    def _functions(self, block):
+        """Generates the functions of the procedures declared in a block,
+        returns (procedure, function name) pairs."""
+        result = []
+        for p in block.procs:
+            fname = self.fnames[id(p)]
+            procs = self._functions(p.block)
+            saved, self.lines = self.lines, []
+            self._line(0, 'def %s(V=V, D=D):' % fname)
+            self._block(p.block, 1, procs, False)
+            self.functions.append(self.lines)
+            self.lines = saved
+            result.append((p, fname))
+        return result
+
+    def _block(self, block, depth, procs, top):
+        start = len(self.lines)
+        for k, v in zip(block.const_names, block.const_values):
+            name = k.text
+            if not (top and self._staticconst(name)):
+                self._line(depth, '_defconst(%d, %d, %d)'
+                           % (self.slots[name], int(v.text), k.linenum))
+        for k in block.var_names:
+            i = self.slots[k.text]
+            self._line(depth, 'V[%d] = None; D[%d] = True' % (i, i))
+        for p, fname in procs:
+            name = p.name.text
+            if not (top and self._staticproc(name)):
+                self._line(depth, '_defproc(%d, %s, %d)'
+                           % (p.slot, fname, p.name.linenum))
+        if block.stmt:
+            self._statement(block.stmt, depth)
+        if len(self.lines) == start:
+            self._line(depth, 'pass')
+
+    def _staticconst(self, name):
+        return name in self.topconsts and name not in self.otherconsts
+
+    def _staticproc(self, name):
+        return name in self.topprocs and name not in self.otherprocs
+
+    def _statement(self, node, depth):
+        kind = node.__class__.__name__
+        if kind == 'AssignStatement':
+            name, i = node.name.text, node.slot
+            if name not in self.topvars:
+                self._line(depth, 'if not D[%d]: _undeclared(%d, %d)'
+                           % (i, i, node.name.linenum))
+            self._line(depth, 'V[%d] = %s' % (i, self._expression(node.expr)))
+        elif kind == 'CallStatement':
+            name = node.proc_name.text
+            if self._staticproc(name):
+                self._line(depth, '%s()' % self.topprocs[name])
+            else:
+                self._line(depth, '_call(%d, %d)'
+                           % (node.slot, node.proc_name.linenum))
+        elif kind == 'SeqStatement':
+            if not node.stmts:
+                self._line(depth, 'pass')
+            for s in node.stmts:
+                self._statement(s, depth)
+        elif kind == 'IfStatement':
+            self._line(depth, 'if %s:' % self._condition(node.cond))
+            self._statement(node.stmt, depth + 1)
+        elif kind == 'WhileStatement':
+            self._line(depth, 'while %s:' % self._condition(node.cond))
+            self._statement(node.stmt, depth + 1)
+        elif kind == 'PrintStatement':
+            self._line(depth, '_write(%s)' % self._expression(node.expr))
+        elif kind == 'InputStatement':
+            i = node.slot
+            self._line(depth, 'V[%d] = _read(%r); D[%d] = True'
+                       % (i, node.variable, i))
+
+    def _condition(self, node):
+        if node.__class__.__name__ == 'OddCondition':
+            # like interp ODD only tests the expression for non zero
+            return self._expression(node.expr)
+        cmp = {'=': '==', '#': '!='}.get(node.cmp.text, node.cmp.text)
+        return '(%s %s %s)' % (self._expression(node.lhs_expr), cmp,
+                               self._expression(node.rhs_expr))
+
+    def _expression(self, node):
+        signs, terms = node.signs, node.terms
+        # like interp a leading sign is accepted but does not change the value
+        if len(signs) == len(terms):
+            signs = signs[1:]
+        # left associative like Python, so long sums need no parentheses
+        code = [self._term(terms[0])]
+        for s, t in zip(signs, terms[1:]):
+            code.extend((s.text, self._term(t)))
+        return ' '.join(code)
+
+    def _term(self, node):
+        code = [self._factor(node.factors[0])]
+        for s, f in zip(node.signs, node.factors[1:]):
+            code.extend((s.text, self._factor(f)))
+        return ' '.join(code)
+
+    def _factor(self, node):
+        kind = node.__class__.__name__
+        if kind == 'NumFactor':
+            return str(int(node.number.text))
+        elif kind == 'ExprFactor':
+            return '(%s)' % self._expression(node.expr)
+        name, line = node.name.text, node.name.linenum
+        if self._staticconst(name):
+            return str(self.topconsts[name])
+        i = node.slot
+        if name in self.topconsts or name in self.otherconsts:
+            return '_load(%d, %d)' % (i, line)
+        return '(V[%d] if V[%d] is not None else _unset(%d, %d))' % (i, i, i, line)
@@ -0,0 +1,111 @@
+## Resolves identifiers to integer slots before execution.
+## Like the symbol table of interp every identifier gets a single slot for
+## the whole program and procedure names get slots of their own. The slots
+## are stored on the nodes:
+##     Block.const_slots, Block.var_slots, Procedure.slot
+##     IdFactor.slot, AssignStatement.slot, InputStatement.slot,
+##     CallStatement.slot
+## so the engines can keep their values in flat lists. Identifiers that
+## are not declared anywhere in the program are reported here, before the
+## program starts, with the same messages the engines use at runtime.
+
+class Symbols(object):
+    def __init__(self):
+        # slot : identifier, procedure slot : procedure name
+        self.names, self.procs = [], []
+        # identifier : slot, procedure name : procedure slot
+        self.nameslots, self.procslots = {}, {}
+        # identifiers declared as constants or variables (or read by @)
+        self.consts, self.vars = set(), set()
+
+    def name(self, text):
+        return _slot(self.names, self.nameslots, text)
+
+    def proc(self, text):
+        return _slot(self.procs, self.procslots, text)
+
+def _slot(lst, slots, text):
+    if text not in slots:
+        slots[text] = len(lst)
+        lst.append(text)
+    return slots[text]
+
+def resolve(node):
+    """Binds the identifiers of a Program and returns its Symbols."""
+    symbols = Symbols()
+    _declareBlock(symbols, node.block)
+    _bindBlock(symbols, node.block)
+    return symbols
+
+## DECLARATIONS
+def _declareBlock(symbols, node):
+    node.const_slots = [symbols.name(k.text) for k in node.const_names]
+    node.var_slots = [symbols.name(k.text) for k in node.var_names]
+    symbols.consts.update([k.text for k in node.const_names])
+    symbols.vars.update([k.text for k in node.var_names])
+    for p in node.procs:
+        p.slot = symbols.proc(p.name.text)
+        _declareBlock(symbols, p.block)
+    if node.stmt:
+        _declareStatement(symbols, node.stmt)
+
+def _declareStatement(symbols, node):
+    # @ declares the variable it reads into
+    kind = node.__class__.__name__
+    if kind == 'InputStatement':
+        node.slot = symbols.name(node.variable)
+        symbols.vars.add(node.variable)
+    elif kind == 'SeqStatement':
+        for s in node.stmts:
+            _declareStatement(symbols, s)
+    elif kind in ('IfStatement', 'WhileStatement'):
+        _declareStatement(symbols, node.stmt)
+
+## BINDINGS
+def _bindBlock(symbols, node):
+    for p in node.procs:
+        _bindBlock(symbols, p.block)
+    if node.stmt:
+        _bindStatement(symbols, node.stmt)
+
+def _bindStatement(symbols, node):
+    kind = node.__class__.__name__
+    if kind == 'AssignStatement':
+        if node.name.text not in symbols.vars:
+            raise Exception('Variable %s assigned before declaration at line %d.'
+                    % (node.name.text, node.name.linenum))
+        node.slot = symbols.nameslots[node.name.text]
+        _bindExpression(symbols, node.expr)
+    elif kind == 'CallStatement':
+        if node.proc_name.text not in symbols.procslots:
+            raise Exception('Procedure %s undefined at line %d.'
+                    % (node.proc_name.text, node.proc_name.linenum))
+        node.slot = symbols.procslots[node.proc_name.text]
+    elif kind == 'SeqStatement':
+        for s in node.stmts:
+            _bindStatement(symbols, s)
+    elif kind in ('IfStatement', 'WhileStatement'):
+        _bindCondition(symbols, node.cond)
+        _bindStatement(symbols, node.stmt)
+    elif kind == 'PrintStatement':
+        _bindExpression(symbols, node.expr)
+
+def _bindCondition(symbols, node):
+    if node.__class__.__name__ == 'OddCondition':
+        _bindExpression(symbols, node.expr)
+    else:
+        _bindExpression(symbols, node.lhs_expr)
+        _bindExpression(symbols, node.rhs_expr)
+
+def _bindExpression(symbols, node):
+    for t in node.terms:
+        for f in t.factors:
+            kind = f.__class__.__name__
+            if kind == 'IdFactor':
+                if f.name.text not in symbols.consts and \
+                   f.name.text not in symbols.vars:
+                    raise Exception('Identifier %s not found at line %d.'
+                            % (f.name.text, f.name.linenum))
+                f.slot = symbols.nameslots[f.name.text]
+            elif kind == 'ExprFactor':
+                _bindExpression(symbols, f.expr)
@@ -1,4 +1,8 @@
 ## SCANNER
+import re
+from collections import deque
+from itertools import islice
+
 class Token(object):
     """Tokentype is one of (ID, NUM, DOT, CONST, EQUAL,
     COMMA, SEMI, VAR, PROCEDURE, ASSIGN, INPUT, CALL, BEGIN, END,
@@ -6,6 +10,7 @@ class Token(object):
     PLUS, MINUS, MUL, DIV, LPAREN, RPAREN, EXCLAIM, EOF, ILLEGAL).
     Please DO NOT touch this doc string.
     """
+    __slots__ = ('text', 'tokentype', 'linenum')
     def __init__(self, txt, tktp, linenum):
         self.text = txt
         self.tokentype = tktp
@@ -23,6 +28,7 @@ class Token(object):
 )(Token.__doc__)
 
 # all token types that can be reconized literally, that is, except ID, NUM, EOF and ILLEGAL
+# the values are the token types themselves (Token.X == 'X')
 literal_words = {
     ':=' : 'ASSIGN',
     '<=' : 'LTEQ',
@@ -55,15 +61,29 @@ literal_words = {
     'ODD' : 'ODD',
 }
 
+# the text of every literal token, shared by all the tokens of its kind
+_literals = dict([(text, text) for text in literal_words])
+
+# a single pattern recognizing every token, tried in the order
+# double-char symbols, single-char symbols, keywords/ids, numbers, illegal
+_tokenpattern = re.compile(r':=|<=|>=|[<>#+\-*/()!.=,;@]|[a-zA-Z]\w*|\d+|\S')
+
 def lookahead(n=1):
     # make sure buffer has at least n tokens
     _replenishbuf(n)
-    return _buf[:n]
+    return list(islice(_buf, n))
+
+def peek():
+    """Returns the next token without consuming it, same as lookahead()[0]."""
+    if not _buf:
+        _replenishbuf(1)
+    return _buf[0]
 
 def nexttoken():
     # make sure buffer has at least 1 token
-    _replenishbuf(1)
-    return _buf.pop(0)
+    if not _buf:
+        _replenishbuf(1)
+    return _buf.popleft()
 
 
 def _replenishbuf(target_size=1):
@@ -85,56 +105,20 @@ def _replenishbuf(target_size=1):
 
 def _tokenizeline(line):
     """Tokenizes a line of PL/0 source code and updates the buffer."""
-    # a simple but working tokenizing algorithm!
-    line = line.rstrip()
-    while line:
-        line = line.lstrip()
-        if line[:2] in (':=', '<=', '>='):
-            # double-char symbols
-            _buf.append(Token(line[:2],
-                                getattr(Token, literal_words[line[:2]]),
-                                _linenum))
-            line = line[2:]
-            continue
-        elif line[0] in ('<', '>', '#', '+', '-', '*', '/',
-                            '(', ')', '!', '.', '=', ',', ';', '@'):
-            # single-char symbols
-            _buf.append(Token(line[0],
-                                getattr(Token, literal_words[line[0]]),
-                                _linenum))
-            line = line[1:]
-            continue
+    append, linenum = _buf.append, _linenum
+    for text in _tokenpattern.findall(line):
+        tokentype = literal_words.get(text)
+        if tokentype:
+            # symbols and keywords
+            append(Token(_literals[text], tokentype, linenum))
+        elif text[0].isalpha():
+            # interned, so every use of a name shares one string
+            append(Token(intern(text), Token.ID, linenum))
+        elif text[0].isdigit():
+            append(Token(intern(text), Token.NUM, linenum))
         else:
-            # keywords, ids, numbers or illegal
-            import re
-            m = re.match('[a-zA-Z]\w*', line)
-            if m:
-                # keywords or ids - they're reconized by the same re
-                # but we need to construct different types of token
-                text = m.group()
-                if literal_words.has_key(text):
-                    # keywords
-                    t = Token(text, getattr(Token, literal_words[text]), _linenum)
-                else:
-                    # ids
-                    t = Token(text, Token.ID, _linenum)
-                _buf.append(t)
-                line = line[len(text):]
-                continue
-            m = re.match('\d+', line)
-            if m:
-                # numbers
-                text = m.group()
-                _buf.append(Token(text, Token.NUM, _linenum))
-                line = line[len(text):]
-                continue
-            # illegal if it's not one of the first three
-            # consider the first part of the line until a whitespace an illegal token
-            print line
-            m = re.match('(\S)\s', line)
-            text = m.group(1)
-            _buf.append(Token(text, Token.ILLEGAL, _linenum))
-            line = line[len(text):]
+            # a character which starts no other token is illegal
+            append(Token(text, Token.ILLEGAL, linenum))
 
 ## AUXILIARIES
 def init(f):
@@ -143,6 +127,6 @@ def init(f):
     global _srcfile, _buf, _linenum
     # the file is opened and closed outside this module
     _srcfile = f
-    _buf = []
+    _buf = deque()
     _linenum = 0
 
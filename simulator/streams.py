@@ -0,0 +1,39 @@
+## Input and output of the engines.
+## Every engine has an Interpreter class built on Streams: a running
+## program reads @ from the stdin and writes ! to the stdout of its own
+## Interpreter instead of the process wide sys.stdin and sys.stdout, so
+## several programs can run in one process at the same time.
+
+import sys
+
+class Streams(object):
+    def __init__(self, stdin=None, stdout=None):
+        # default to the streams of the process when the instance is made
+        self.stdin = stdin if stdin is not None else sys.stdin
+        self.stdout = stdout if stdout is not None else sys.stdout
+
+    def write(self, value):
+        """Writes the value of a ! statement on a line of its own."""
+        self.stdout.write(str(value) + '\n')
+
+    def read(self, name):
+        """Returns the number an @ statement reads into a variable,
+        prompting and failing like raw_input."""
+        self.prompt(name)
+        return self.number()
+
+    def prompt(self, name):
+        self.stdout.write('INPUT ' + name + ': ')
+        self.stdout.flush()
+
+    def ready(self):
+        """Whether number() can read without blocking. Files always can,
+        an stdin with a ready() of its own (cooperative.Pipe) tells."""
+        ready = getattr(self.stdin, 'ready', None)
+        return ready is None or ready()
+
+    def number(self):
+        line = self.stdin.readline()
+        if not line:
+            raise EOFError('EOF when reading a line')
+        return int(line.rstrip('\n'))
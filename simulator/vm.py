@@ -0,0 +1,347 @@
+## A stack based bytecode VM for the AST.
+## assemble() compiles a Program into a flat array('i') of fixed width
+## instructions (opcode, operand, operand) and execute() runs them in a
+## single dispatch loop. Procedure calls push their return address on an
+## explicit frame stack instead of recursing in Python, so the depth of
+## CALL chains is only limited by STACK_BUDGET. A CALL right before a RET
+## is assembled as TAILCALL, which reuses the frame of the caller, so
+## tail recursion runs in constant space.
+##
+## steps() runs the same loop as a generator for cooperative execution:
+## given a quantum it yields False after that many loop iterations and
+## procedure calls (JMP, CALL and TAILCALL, the only ways back to code
+## already run, so the code between two yields is bounded), and True
+## while an @ waits for input that is not ready yet.
+##
+## Like interp every identifier has one global slot: constants take
+## priority over variables, VAR declarations reset a variable each time
+## their block is entered and procedures are registered on block entry.
+## The slots come from resolve. The runtime errors are the same, except
+## that an assignment to a variable whose VAR has not been reached yet is
+## reported after its expression is evaluated.
+
+from array import array
+
+import resolve
+import streams
+
+# opcodes
+(HALT, LIT, LOAD, STORE, DEFCONST, DECLVAR, DEFPROC, CALL, RET, JMP, JPF,
+ ADD, SUB, MUL, DIV, EQ, NE, LT, LE, GT, GE, PRINT, INPUT, TAILCALL) = range(24)
+
+OPNAMES = ('HALT', 'LIT', 'LOAD', 'STORE', 'DEFCONST', 'DECLVAR', 'DEFPROC',
+           'CALL', 'RET', 'JMP', 'JPF', 'ADD', 'SUB', 'MUL', 'DIV', 'EQ',
+           'NE', 'LT', 'LE', 'GT', 'GE', 'PRINT', 'INPUT', 'TAILCALL')
+
+# every instruction takes this many slots in the code array
+WIDTH = 3
+
+_arith = {'+': ADD, '-': SUB, '*': MUL, '/': DIV}
+_compare = {'=': EQ, '#': NE, '<': LT, '<=': LE, '>': GT, '>=': GE}
+
+# bytes the frame stack may use, a frame is one return address
+STACK_BUDGET = 64 * 1024 * 1024
+
+# marks a slot whose variable has never been declared
+_undeclared = object()
+
+class Bytecode(object):
+    """The output of assemble(): the instruction array plus the tables its
+    operands refer to."""
+    def __init__(self, symbols):
+        self.code = array('i')
+        # source line of each instruction, used in error messages
+        self.lines = array('i')
+        # numbers used by LIT and DEFCONST
+        self.pool = []
+        # identifier and procedure name of every slot
+        self.names, self.procs = symbols.names, symbols.procs
+
+    def emit(self, op, a=0, b=0, linenum=0):
+        self.code.extend((op, a, b))
+        self.lines.append(linenum)
+        return len(self.code) - WIDTH
+
+    def patch(self, pc, value, operand=1):
+        self.code[pc + operand] = value
+
+    def here(self):
+        return len(self.code)
+
+    def number(self, value):
+        self.pool.append(value)
+        return len(self.pool) - 1
+
+
+## ASSEMBLER
+def assemble(node):
+    bc = Bytecode(resolve.resolve(node))
+    # procedures are emitted after the main program, DEFPROC gets patched
+    pending = []
+    _assembleBlock(bc, node.block, pending)
+    bc.emit(HALT)
+    while pending:
+        defproc, block = pending.pop(0)
+        bc.patch(defproc, bc.here(), 2)
+        _assembleBlock(bc, block, pending)
+        bc.emit(RET)
+    # a call whose procedure returns straight to a RET can return for it
+    for pc in range(0, len(bc.code) - WIDTH, WIDTH):
+        if bc.code[pc] == CALL and bc.code[pc + WIDTH] == RET:
+            bc.code[pc] = TAILCALL
+    return bc
+
+def _assembleBlock(bc, node, pending):
+    for k, v, i in zip(node.const_names, node.const_values, node.const_slots):
+        bc.emit(DEFCONST, i, bc.number(int(v.text)), k.linenum)
+    for k, i in zip(node.var_names, node.var_slots):
+        bc.emit(DECLVAR, i, 0, k.linenum)
+    for p in node.procs:
+        pending.append((bc.emit(DEFPROC, p.slot, 0, p.name.linenum), p.block))
+    if node.stmt:
+        _assembleStatement(bc, node.stmt)
+
+def _assembleStatement(bc, node):
+    kind = node.__class__.__name__
+    if kind == 'AssignStatement':
+        _assembleExpression(bc, node.expr)
+        bc.emit(STORE, node.slot, 0, node.name.linenum)
+    elif kind == 'CallStatement':
+        bc.emit(CALL, node.slot, 0, node.proc_name.linenum)
+    elif kind == 'SeqStatement':
+        for s in node.stmts:
+            _assembleStatement(bc, s)
+    elif kind == 'IfStatement':
+        _assembleCondition(bc, node.cond)
+        jpf = bc.emit(JPF)
+        _assembleStatement(bc, node.stmt)
+        bc.patch(jpf, bc.here())
+    elif kind == 'WhileStatement':
+        top = bc.here()
+        _assembleCondition(bc, node.cond)
+        jpf = bc.emit(JPF)
+        _assembleStatement(bc, node.stmt)
+        bc.emit(JMP, top)
+        bc.patch(jpf, bc.here())
+    elif kind == 'PrintStatement':
+        _assembleExpression(bc, node.expr)
+        bc.emit(PRINT)
+    elif kind == 'InputStatement':
+        bc.emit(INPUT, node.slot)
+
+def _assembleCondition(bc, node):
+    if node.__class__.__name__ == 'OddCondition':
+        # like interp ODD only tests the expression for non zero
+        _assembleExpression(bc, node.expr)
+    else:
+        _assembleExpression(bc, node.lhs_expr)
+        _assembleExpression(bc, node.rhs_expr)
+        bc.emit(_compare[node.cmp.text], 0, 0, node.cmp.linenum)
+
+def _assembleExpression(bc, node):
+    signs, terms = node.signs, node.terms
+    # like interp a leading sign is accepted but does not change the value
+    if len(signs) == len(terms):
+        signs = signs[1:]
+    _assembleTerm(bc, terms[0])
+    for s, t in zip(signs, terms[1:]):
+        _assembleTerm(bc, t)
+        bc.emit(_arith[s.text], 0, 0, s.linenum)
+
+def _assembleTerm(bc, node):
+    _assembleFactor(bc, node.factors[0])
+    for s, f in zip(node.signs, node.factors[1:]):
+        _assembleFactor(bc, f)
+        bc.emit(_arith[s.text], 0, 0, s.linenum)
+
+def _assembleFactor(bc, node):
+    kind = node.__class__.__name__
+    if kind == 'IdFactor':
+        bc.emit(LOAD, node.slot, 0, node.name.linenum)
+    elif kind == 'NumFactor':
+        bc.emit(LIT, bc.number(int(node.number.text)), 0, node.number.linenum)
+    elif kind == 'ExprFactor':
+        _assembleExpression(bc, node.expr)
+
+## VM
+class Interpreter(streams.Streams):
+    def __init__(self, stdin=None, stdout=None, stack_budget=None):
+        streams.Streams.__init__(self, stdin, stdout)
+        # bytes the frame stack may use, STACK_BUDGET when None
+        self.stack_budget = stack_budget
+        # slot : number, value or _undeclared, procedure slot : address,
+        # filled by execute()
+        self.consts, self.values, self.procs = [], [], []
+
+    def run(self, node):
+        self.execute(assemble(node))
+
+    def execute(self, bc):
+        for waiting in self.steps(bc):
+            pass
+
+    def steps(self, bc, quantum=None):
+        """Returns a generator running the bytecode, see the top of the
+        module. Without a quantum it runs to the end in one go."""
+        code, lines, pool, names = bc.code, bc.lines, bc.pool, bc.names
+        consts = self.consts = [None] * len(names)
+        values = self.values = [_undeclared] * len(names)
+        procs = self.procs = [None] * len(bc.procs)
+        write, prompt, ready, number = self.write, self.prompt, self.ready, self.number
+        turns = quantum
+        stack, frames = [], array('i')
+        budget = self.stack_budget
+        maxframes = (budget if budget is not None else STACK_BUDGET) // frames.itemsize
+        push, pop = stack.append, stack.pop
+        pc = 0
+        while True:
+            op = code[pc]
+            if op == LOAD:
+                a = code[pc + 1]
+                v = consts[a]
+                if v is None:
+                    v = values[a]
+                    if v is None:
+                        raise Exception('Variable %s used before initialized at line %d.'
+                                % (names[a], lines[pc // WIDTH]))
+                    elif v is _undeclared:
+                        raise Exception('Identifier %s not found at line %d.'
+                                % (names[a], lines[pc // WIDTH]))
+                push(v)
+            elif op == LIT:
+                push(pool[code[pc + 1]])
+            elif op == JPF:
+                if not pop():
+                    pc = code[pc + 1]
+                    continue
+            elif op == JMP:
+                pc = code[pc + 1]
+                if quantum:
+                    turns -= 1
+                    if not turns:
+                        turns = quantum
+                        yield False
+                continue
+            elif op == STORE:
+                a = code[pc + 1]
+                if values[a] is _undeclared:
+                    raise Exception('Variable %s assigned before declaration at line %d.'
+                            % (names[a], lines[pc // WIDTH]))
+                values[a] = pop()
+            elif op == ADD:
+                v = pop()
+                stack[-1] += v
+            elif op == SUB:
+                v = pop()
+                stack[-1] -= v
+            elif op == MUL:
+                v = pop()
+                stack[-1] *= v
+            elif op == DIV:
+                v = pop()
+                stack[-1] /= v
+            elif op == EQ:
+                v = pop()
+                stack[-1] = stack[-1] == v
+            elif op == NE:
+                v = pop()
+                stack[-1] = not stack[-1] == v
+            elif op == LT:
+                v = pop()
+                stack[-1] = stack[-1] < v
+            elif op == LE:
+                v = pop()
+                stack[-1] = stack[-1] <= v
+            elif op == GT:
+                v = pop()
+                stack[-1] = stack[-1] > v
+            elif op == GE:
+                v = pop()
+                stack[-1] = stack[-1] >= v
+            elif op == CALL:
+                a = code[pc + 1]
+                if procs[a] is None:
+                    raise Exception('Procedure %s undefined at line %d.'
+                            % (bc.procs[a], lines[pc // WIDTH]))
+                if len(frames) >= maxframes:
+                    raise Exception('Stack overflow calling procedure %s at line %d.'
+                            % (bc.procs[a], lines[pc // WIDTH]))
+                frames.append(pc + WIDTH)
+                pc = procs[a]
+                if quantum:
+                    turns -= 1
+                    if not turns:
+                        turns = quantum
+                        yield False
+                continue
+            elif op == TAILCALL:
+                a = code[pc + 1]
+                if procs[a] is None:
+                    raise Exception('Procedure %s undefined at line %d.'
+                            % (bc.procs[a], lines[pc // WIDTH]))
+                pc = procs[a]
+                if quantum:
+                    turns -= 1
+                    if not turns:
+                        turns = quantum
+                        yield False
+                continue
+            elif op == RET:
+                pc = frames.pop()
+                continue
+            elif op == PRINT:
+                write(pop())
+            elif op == INPUT:
+                a = code[pc + 1]
+                prompt(names[a])
+                if quantum:
+                    while not ready():
+                        yield True
+                values[a] = number()
+            elif op == DECLVAR:
+                values[code[pc + 1]] = None
+            elif op == DEFCONST:
+                a = code[pc + 1]
+                if consts[a] is not None:
+                    raise Exception('Const %s cannot be redefined at line %d.'
+                            % (names[a], lines[pc // WIDTH]))
+                consts[a] = pool[code[pc + 2]]
+            elif op == DEFPROC:
+                a = code[pc + 1]
+                if procs[a] is not None:
+                    raise Exception('Procedure %s cannot be redeclared at line %d.'
+                            % (bc.procs[a], lines[pc // WIDTH]))
+                procs[a] = code[pc + 2]
+            elif op == HALT:
+                return
+            pc += WIDTH
+
+def interpret(node):
+    Interpreter().run(node)
+
+def execute(bc):
+    Interpreter().execute(bc)
+
+## DISASSEMBLER
+def disassemble(bc):
+    """Returns a readable listing of the bytecode, one instruction a line."""
+    result = []
+    for pc in range(0, len(bc.code), WIDTH):
+        op, a, b = bc.code[pc], bc.code[pc + 1], bc.code[pc + 2]
+        if op in (LOAD, STORE, DECLVAR, INPUT):
+            args = bc.names[a]
+        elif op == LIT:
+            args = str(bc.pool[a])
+        elif op == DEFCONST:
+            args = '%s = %s' % (bc.names[a], bc.pool[b])
+        elif op == DEFPROC:
+            args = '%s @%d' % (bc.procs[a], b)
+        elif op in (CALL, TAILCALL):
+            args = bc.procs[a]
+        elif op in (JMP, JPF):
+            args = '@%d' % a
+        else:
+            args = ''
+        result.append('%6d  %-9s %-20s ; line %d'
+                      % (pc, OPNAMES[op], args, bc.lines[pc // WIDTH]))
+    return '\n'.join(result)
@@ -1 +1 @@
-__all__ = ['compiler', 'nodes', 'parser']
\ No newline at end of file
+__all__ = ['cache', 'compiler', 'nodes', 'parser', 'sourcemap']
\ No newline at end of file
@@ -0,0 +1,223 @@
+import os, hashlib, cPickle
+
+#environment variable that can name the cache directory
+CACHE_DIR_ENV = 'MARGS_CACHE_DIR'
+
+#default upper bound of the cache size in bytes
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+#file extensions of the cached entries
+PL0_EXT = '.pl0'
+AST_EXT = '.ast'
+MAP_EXT = '.map'
+
+#package directory : fingerprint of its source files
+_fingerprints = dict()
+
+def fingerprint(directory):
+  """
+  Returns a hash of the python source files of a package directory, so cached entries are dropped whenever the code producing them changes.
+  directory (string): The package directory to hash.
+  """
+  if directory not in _fingerprints:
+    h = hashlib.sha1()
+    for fn in sorted(os.listdir(directory)):
+      if fn.endswith('.py'):
+        h.update(fn)
+        h.update(open(os.path.join(directory, fn), 'rb').read())
+    _fingerprints[directory] = h.hexdigest()
+  return _fingerprints[directory]
+
+def translator_version():
+  """
+  Returns the fingerprint of the translator package.
+  """
+  return fingerprint(os.path.dirname(os.path.abspath(__file__)))
+
+class Cache():
+  def __init__(self, directory = None, max_size = DEFAULT_MAX_SIZE):
+    """
+    The content addressed cache of translated programs. Entries are files named by the SHA-1 of the Margs source and the translator version.
+    directory (string): The cache directory, defaults to $MARGS_CACHE_DIR or ~/.cache/margs.
+    max_size (int): Size in bytes above which the least recently used entries are evicted.
+    """
+    if directory == None:
+      directory = os.environ.get(CACHE_DIR_ENV) or os.path.join(os.path.expanduser('~'), '.cache', 'margs')
+    self.directory = directory
+    self.max_size = max_size
+    self.hits = 0 #translations answered from the cache
+    self.misses = 0 #translations that had to be done
+    self.evictions = 0 #entries removed to stay under max_size
+    self._size = None #estimated size of the entries, computed on the first put
+
+  def key(self, source, *versions):
+    """
+    Returns the key of a Margs source.
+    source (string): The Margs source code.
+    versions (strings): Fingerprints of the code producing the entry.
+    """
+    h = hashlib.sha1()
+    for v in (translator_version(), ) + versions:
+      h.update(v + '\n')
+    h.update(source)
+    return h.hexdigest()
+
+  def path(self, key, ext):
+    """
+    Returns the file of an entry, entries are spread over subdirectories by the first two digits of the key.
+    key (string): The key of the entry.
+    ext (string): The kind of entry (PL0_EXT, MAP_EXT or AST_EXT).
+    """
+    return os.path.join(self.directory, key[:2], key + ext)
+
+  def get(self, key, ext = PL0_EXT, count = True):
+    """
+    Returns the cached data of a key or None. A hit refreshes the entry for the LRU eviction.
+    key (string): The key of the entry.
+    ext (string): The kind of entry (PL0_EXT, MAP_EXT or AST_EXT).
+    count (bool, optional): Whether to count the lookup as a hit or miss, off when a translation looks up several entries and counts itself.
+    """
+    path = self.path(key, ext)
+    try:
+      f = open(path, 'rb')
+      try:
+        data = f.read()
+      finally:
+        f.close()
+      os.utime(path, None)
+    except (IOError, OSError):
+      data = None
+    if count:
+      self.count(data != None)
+    return data
+
+  def count(self, hit):
+    """
+    Counts one translation as a hit or a miss.
+    hit (bool): Whether the translation was answered from the cache.
+    """
+    if hit:
+      self.hits += 1
+    else:
+      self.misses += 1
+
+  def put(self, key, data, ext = PL0_EXT):
+    """
+    Stores data under a key, then evicts old entries if the cache grew too large.
+    key (string): The key of the entry.
+    data (string): The data to store.
+    ext (string): The kind of entry (PL0_EXT, MAP_EXT or AST_EXT).
+    """
+    path = self.path(key, ext)
+    try:
+      if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+      #write to a temporary file first so concurrent readers never see half an entry
+      tmp = '%s.%d.tmp' % (path, os.getpid())
+      f = open(tmp, 'wb')
+      try:
+        f.write(data)
+      finally:
+        f.close()
+      os.rename(tmp, path)
+    except (IOError, OSError):
+      return False
+    #only scan the directory once the estimate says it may be too large
+    if self._size == None:
+      self._size = self.size()
+    else:
+      self._size += len(data)
+    if self._size > self.max_size:
+      self.evict()
+    return True
+
+  def get_ast(self, key, count = True):
+    """
+    Returns the cached simulator AST of a key or None.
+    key (string): The key of the entry.
+    count (bool, optional): Whether to count the lookup as a hit or miss.
+    """
+    data = self.get(key, AST_EXT, count)
+    if data == None:
+      return None
+    try:
+      return cPickle.loads(data)
+    except Exception:
+      return None
+
+  def put_ast(self, key, ast):
+    """
+    Stores a simulator AST under a key. Trees too deep to pickle are skipped.
+    key (string): The key of the entry.
+    ast (Program): The abstract syntax tree generated by the simulator.
+    """
+    try:
+      data = cPickle.dumps(ast, 2)
+    except RuntimeError: #maximum recursion depth exceeded
+      return False
+    return self.put(key, data, AST_EXT)
+
+  def entries(self):
+    """
+    Returns (modification time, size, path) of every entry.
+    """
+    result = list()
+    if not os.path.isdir(self.directory):
+      return result
+    for sub in os.listdir(self.directory):
+      subdir = os.path.join(self.directory, sub)
+      if not os.path.isdir(subdir):
+        continue
+      for fn in os.listdir(subdir):
+        if fn.endswith(PL0_EXT) or fn.endswith(AST_EXT) or fn.endswith(MAP_EXT):
+          path = os.path.join(subdir, fn)
+          try:
+            st = os.stat(path)
+          except OSError: #removed by another process
+            continue
+          result.append((st.st_mtime, st.st_size, path))
+    return result
+
+  def size(self):
+    """
+    Returns the total size of the entries in bytes.
+    """
+    return sum([size for mtime, size, path in self.entries()])
+
+  def evict(self):
+    """
+    Removes the least recently used entries until the cache fits in max_size.
+    """
+    entries = self.entries()
+    total = sum([size for mtime, size, path in entries])
+    entries.sort()
+    for mtime, size, path in entries:
+      if total <= self.max_size:
+        break
+      try:
+        os.remove(path)
+        self.evictions += 1
+      except OSError:
+        pass
+      total -= size
+    self._size = total
+
+  def clear(self):
+    """
+    Removes every entry.
+    """
+    for mtime, size, path in self.entries():
+      try:
+        os.remove(path)
+      except OSError:
+        pass
+    self._size = 0
+
+  def __str__(self):
+    """
+    String representation of the cache statistics.
+    """
+    lookups = self.hits + self.misses
+    rate = 100.0 * self.hits / lookups if lookups else 0.0
+    return 'Cache %s: %d hits, %d misses (%.1f%% hit rate), %d evicted, %d bytes' % (
+      self.directory, self.hits, self.misses, rate, self.evictions, self.size())
@@ -1,7 +1,10 @@
 import sys, os
-from parser import Token
+from parser import Token, TokenTable, TYPES, CODES
 from nodes import Program
 
+#functions with at most this many statements are inlined at their call sites, 0 turns inlining off
+INLINE_THRESHOLD = 8
+
 def callee():
   """
   Returns the name of the class which called a given function (used in error reporting)
@@ -10,65 +13,203 @@ def callee():
 
 class Compiler():
   
-  #valid token types which can comprise a <Statement>
-  valid_statement_tokens = [
+  #type codes (see parser.CODES) of the valid tokens which can comprise a <Statement>, tested against code()
+  valid_statement_tokens = frozenset([CODES[t] for t in (
     Token.LBLOCK, Token.VAR, Token.CONST, Token.IDENTIFIER, Token.IF,
-    Token.INPUT, Token.OUTPUT, Token.WHILE, Token.SEMI]
+    Token.INPUT, Token.OUTPUT, Token.WHILE, Token.SEMI)])
   
-  #valid token types which can comprise an <Expression>
-  valid_expression_tokens = [
+  #type codes of the valid tokens which can comprise an <Expression>
+  valid_expression_tokens = frozenset([CODES[t] for t in (
     Token.NUMBER, Token.IDENTIFIER, Token.LPAREN, Token.RPAREN,
-    Token.PLUS, Token.MINUS, Token.DIV, Token.MUL, Token.TRUE, Token.FALSE]
+    Token.PLUS, Token.MINUS, Token.DIV, Token.MUL, Token.TRUE, Token.FALSE)])
   
-  #valid token types which can comprise a <Comparison> token
-  valid_comparison_tokens = [
+  #type codes of the valid tokens which can comprise a <Comparison> token
+  valid_comparison_tokens = frozenset([CODES[t] for t in (
     Token.LTEQ, Token.GTEQ, Token.GT,
-    Token.LT, Token.EQUAL, Token.NOTEQUAL]
+    Token.LT, Token.EQUAL, Token.NOTEQUAL)])
   
-  def __init__(self, tokens):
+  def __init__(self, tokens, inline = INLINE_THRESHOLD):
     """
     Compiler initializer.
-    tokens (list): Tokens produced by the parser
+    tokens (TokenTable or list): Tokens produced by the parser, either parsed up front or from Parser.stream()
+    inline (int, optional): Size in statements up to which functions are inlined (see INLINE_THRESHOLD)
     """
-    self.tokens = tokens
+    self.tokens = TokenStream(tokens)
+    self.inline_threshold = inline
+    self.inline = dict() #name : Function of the functions inlined at their call sites, filled by Program.optimize()
+    self.function = None #Function being optimized, None for the main program
     self.compiled = list() #compiled code generated by run()
+    self.constants = dict() #name : value of the global integer constants, filled by Program.optimize()
+    self.flags = 0 #number of ELSE flag variables generated by Statement_Conditional.compile()
   
   def run(self):
     """
-    Compiles the code
+    Compiles the code, one stage after the other
     """
-    if len(self.tokens) == 0: #case when the program is empty
+    if not self.tokens.available(): #case when the program is empty
       self.compiled = ['.']
       return
-    preserved_tokens = self.tokens[:] #preserve the tokens because they're consumed during compilation
+    self.build()
+    self.clean()
+    self.optimize()
+    self.compile()
+  
+  def build(self):
+    """
+    Parse the tokens into the node tree of the program
+    """
+    first = self.tokens.peek() #the tokens are consumed during compilation
     self.program = Program(self).build() #begin recursive descent parsing
-    self.tokens = preserved_tokens #restore the tokens
-    self.program.clean() #begin the recursive clean/modification process (to translate to PL/0)
-    self.program.compile() #generate the compiled PL/0 code
+    self.tokens = TokenStream([first]) #errors from here on are reported against the first token
+  
+  def clean(self):
+    """
+    Modify the node tree so it can be translated to PL/0
+    """
+    self.program.clean() #begin the recursive clean/modification process
+  
+  def optimize(self):
+    """
+    Fold constants, simplify expressions, drop dead code and inline small functions
+    """
+    self.program.optimize()
+  
+  def compile(self):
+    """
+    Generate the compiled PL/0 code in self.compiled
+    """
+    self.program.compile()
   
   def error(self, text):
     """
     The compiler found a grammar error and will report it to the user. All errors are fatal
     text (string): Error message to report to user.
     """
-    quit('LINE ' + str(self.tokens[0].line) + ' (Token: "' + self.tokens[0].text + '") ERROR <' + callee().lstrip('_').upper() + '> : ' + text)
+    token = self.tokens.peek() or self.tokens.peek(-1) #report the last token when the input ran out
+    quit('LINE ' + str(token.line) + ' (Token: "' + token.text + '") ERROR <' + callee().lstrip('_').upper() + '> : ' + text)
   
   def next(self, pos = 0):
     """
     Return the type of token pos positions ahead in the token list.
     pos (int, optional): The position to lookup within the tokens.
     """
-    return "<NONE>" if len(self.tokens) <= pos else self.tokens[pos].type
+    _type = self.tokens.type(pos)
+    return "<NONE>" if _type == None else _type
+  
+  def code(self, pos = 0):
+    """
+    Return the type code (see parser.CODES) of the token pos positions ahead in the token list, or None if there is no such token.
+    pos (int, optional): The position to lookup within the tokens.
+    """
+    return self.tokens.code(pos)
   
   def skip(self, pos = 1):
     """
     Tell the compiler to skip/discard pos number of tokens.
     pos (int, optional): The number of tokens to skip/discard.
     """
-    self.tokens = self.tokens[pos:]
+    self.tokens.skip(pos)
     
   def __str__(self):
     """
     String representation of the compiler
     """
-    return ''.join([str(i) for i in self.compiled])
\ No newline at end of file
+    return ''.join(self.compiled)
+
+class TokenStream():
+  """
+  Cursor over the tokens produced by the parser. Consuming a token only moves the cursor, so the token list is never copied.
+  When built from the TokenTable of Parser.stream() the tokens are scanned on demand and consumed tokens are discarded, keeping only a small window for lookahead and rewind().
+  """
+  
+  history = 16 #consumed tokens kept available to rewind() when streaming
+  chunk = 256 #tokens scanned at a time when streaming
+  
+  def __init__(self, tokens):
+    """
+    TokenStream initializer.
+    tokens (TokenTable or list): Tokens produced by the parser
+    """
+    self.tokens = tokens
+    self.codes = tokens.types if isinstance(tokens, TokenTable) else None #type codes read by type() and code() without building Tokens
+    self.streaming = self.codes != None and tokens.source != None #whether consumed tokens are discarded
+    self.end = len(self.tokens) #index one past the last buffered token within the whole stream
+    self.base = 0 #index of self.tokens[0] within the whole stream
+    self.pos = 0 #index of the next unconsumed token within the whole stream
+  
+  def available(self, count = 1):
+    """
+    Return whether at least count tokens remain to be consumed.
+    count (int, optional): The number of tokens required.
+    """
+    return self._fill(self.pos + count)
+  
+  def peek(self, pos = 0):
+    """
+    Return the token pos positions ahead of the cursor, or None if there is no such token.
+    pos (int, optional): The position to lookup relative to the cursor.
+    """
+    index = self.pos + pos
+    if index < self.base or not self._fill(index + 1):
+      return None
+    return self.tokens[index - self.base]
+  
+  def type(self, pos = 0):
+    """
+    Return the type of the token pos positions ahead of the cursor, or None if there is no such token. Reads a TokenTable without building the Token.
+    pos (int, optional): The position to lookup relative to the cursor.
+    """
+    index = self.pos + pos
+    if index < self.base or (index >= self.end and not self._fill(index + 1)):
+      return None
+    if self.codes != None:
+      return TYPES[self.codes[index - self.base]]
+    return self.tokens[index - self.base].type
+  
+  def code(self, pos = 0):
+    """
+    Return the type code of the token pos positions ahead of the cursor, or None if there is no such token.
+    pos (int, optional): The position to lookup relative to the cursor.
+    """
+    index = self.pos + pos
+    if index < self.base or (index >= self.end and not self._fill(index + 1)):
+      return None
+    if self.codes != None:
+      return self.codes[index - self.base]
+    return CODES[self.tokens[index - self.base].type]
+  
+  def skip(self, count = 1):
+    """
+    Consume count tokens.
+    count (int, optional): The number of tokens to consume.
+    """
+    self._fill(self.pos + count)
+    self.pos = min(self.pos + count, self.end)
+    if self.streaming and self.pos - self.base > 64 * self.history: #drop consumed tokens, keeping the history
+      drop = self.pos - self.base - self.history
+      self.tokens.drop(drop)
+      self.base += drop
+  
+  def mark(self):
+    """
+    Return the current cursor position so it can be restored with rewind().
+    """
+    return self.pos
+  
+  def rewind(self, mark):
+    """
+    Move the cursor back to a position returned by mark().
+    mark (int): The position to restore. When streaming it must be within the kept history.
+    """
+    if mark < self.base: raise IndexError('cannot rewind past discarded tokens')
+    self.pos = mark
+  
+  def _fill(self, end):
+    """
+    Scan tokens until the token at index end - 1 is buffered. Returns whether it exists.
+    end (int): Index within the whole stream one past the token needed.
+    """
+    if self.end < end and self.streaming:
+      self.tokens.fill(end - self.base + self.chunk)
+      self.end = self.base + len(self.tokens)
+    return end <= self.end
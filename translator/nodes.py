@@ -1,5 +1,6 @@
 from parser import Token
-from copy import copy
+from sourcemap import SourceLine
+from copy import copy, deepcopy
 
 class Node():
   """
@@ -11,6 +12,8 @@ class Node():
     Initializer for the Node.
     """
     self.compiler = compiler
+    self.line = None #Margs line the node starts on (set for statements and functions)
+    self.origin = SourceLine.STATEMENT #why the node exists, synthesized statements are tagged with the SourceLine kinds
   
   def build(self):
     """
@@ -24,12 +27,26 @@ class Node():
     """
     pass
   
+  def optimize(self):
+    """
+    Simplify the cleaned node before it is compiled. Returns the node to compile in its place.
+    """
+    return self
+  
   def compile(self, indent = 0):
     """
     Generate the compiled PL/0 code for the given node.
     indent (int, optional): The level of indentation for the given node in the compiled program.
     """
     pass
+  
+  def mark(self, origin = None):
+    """
+    Record in the compiled code that the PL/0 emitted next comes from this node's Margs line (see translator.sourcemap).
+    origin (string, optional): Kind of the code emitted next, defaults to the origin of the node.
+    """
+    if self.line != None:
+      self.compiler.compiled.append(SourceLine(self.line, origin or self.origin))
 
 def _indent(num = 0):
   """
@@ -38,13 +55,47 @@ def _indent(num = 0):
   """
   return str('  ' * num)
 
+def _optimize_all(nodes):
+  """
+  Helper function to optimize a list of nodes, dropping the ones optimized away (None)
+  nodes (list): The nodes to optimize
+  """
+  return [node for node in [node.optimize() for node in nodes] if node != None]
+
+def _statements(nodes):
+  """
+  Helper generator yielding the given statements and every statement nested in them
+  nodes (list): The statements to walk
+  """
+  for node in nodes:
+    yield node
+    if isinstance(node, Statement_List):
+      for nested in _statements(node.statements): yield nested
+    elif isinstance(node, Statement_Conditional):
+      for nested in _statements([node.if_statement] + ([node.else_statement] if node.else_statement != None else [])): yield nested
+    elif isinstance(node, Statement_Iteration):
+      for nested in _statements([node.body]): yield nested
+
+def _reachable(calls, name):
+  """
+  Helper function returning the names of the functions which can be reached by the calls made from a function
+  calls (dict): name : names of the functions called by the function
+  name (string): The function to start from
+  """
+  found, pending = set(), list(calls.get(name, ()))
+  while pending:
+    callee = pending.pop()
+    if callee not in found:
+      found.add(callee)
+      pending.extend(calls.get(callee, ()))
+  return found
 
 class Comparison(Node):
   """
   Comparison node from the Grammar.
   """
   
-  #translations for straight conversion (true => true)
+  #translations to PL/0
   normal = {
     '<=' : '<=',
     '>=' : '>=',
@@ -54,28 +105,28 @@ class Comparison(Node):
     '!=' : '#'
   }
   
-  #translations for inverted conversion (true => false)
-  inverted = {
-    '<=' : '>=',
-    '>=' : '<=',
-    '<'  : '>',
-    '>'  : '<',
-    '==' : '#',
-    '!=' : '='
+  #evaluations for conditions folded at compile time
+  evaluate = {
+    '<=' : lambda left, right: left <= right,
+    '>=' : lambda left, right: left >= right,
+    '<'  : lambda left, right: left < right,
+    '>'  : lambda left, right: left > right,
+    '==' : lambda left, right: left == right,
+    '!=' : lambda left, right: left != right
   }
   
   def __init__(self, compiler = None):
     Node.__init__(self, compiler) #call the parent abstract method
   
   def build(self):
-    if len(self.compiler.tokens) == 0: self.compiler.error('must contain at least 1 token for valid syntax')
-    if self.compiler.next() not in self.compiler.valid_comparison_tokens: self.compiler.error('COMPARISON token expected. Found ' + self.compiler.next())
-    self.comparison = self.compiler.tokens[0].text
+    if not self.compiler.tokens.available(): self.compiler.error('must contain at least 1 token for valid syntax')
+    if self.compiler.code() not in self.compiler.valid_comparison_tokens: self.compiler.error('COMPARISON token expected. Found ' + self.compiler.next())
+    self.comparison = self.compiler.tokens.peek().text
     self.compiler.skip(1) # <comparison>
     return self
   
-  def compile(self, indent = 0, inverse = False):
-    self.compiler.compiled.append(self.normal[self.comparison] if not inverse else self.inverted[self.comparison])
+  def compile(self, indent = 0):
+    self.compiler.compiled.append(self.normal[self.comparison])
 
 class Condition(Node):
   """
@@ -90,9 +141,9 @@ class Condition(Node):
     self.boolean = None # The boolean operation (if no comparison is made)
   
   def build(self):
-    if len(self.compiler.tokens) < 3: self.compiler.error("must contain at least 3 tokens for valid syntax")
+    if not self.compiler.tokens.available(3): self.compiler.error("must contain at least 3 tokens for valid syntax")
     if self.compiler.next() in (Token.TRUE, Token.FALSE):
-      self.boolean = self.compiler.tokens[0].type
+      self.boolean = self.compiler.tokens.peek().type
       self.compiler.skip(1)
     else:
       self.left = Expression(self.compiler).build()
@@ -100,15 +151,32 @@ class Condition(Node):
       self.right = Expression(self.compiler).build()
     return self
   
-  def compile(self, indent = 0, inverse = False):
+  def optimize(self):
+    if self.boolean == None:
+      self.left = self.left.optimize()
+      self.right = self.right.optimize()
+    return self
+  
+  def value(self):
+    """
+    Returns True or False if the condition is a boolean or optimize() folded both sides to numbers, otherwise None.
+    """
+    if self.boolean != None:
+      return self.boolean == Token.TRUE
+    left, right = self.left.value(), self.right.value()
+    if left == None or right == None:
+      return None
+    return self.comparison.evaluate[self.comparison.comparison](left, right)
+  
+  def compile(self, indent = 0):
     if self.boolean != None: #it's a boolean and not a comparison (true or false)
       if self.boolean == Token.TRUE:
-        self.compiler.compiled.append('1=1' if not inverse else '1#1')
+        self.compiler.compiled.append('1=1')
       elif self.boolean == Token.FALSE:
-        self.compiler.compiled.append('1#1' if not inverse else '1=1')
+        self.compiler.compiled.append('1#1')
     else:
       self.left.compile()
-      self.comparison.compile(inverse = inverse)
+      self.comparison.compile()
       self.right.compile()
 
 class Declaration(Node):
@@ -123,10 +191,10 @@ class Declaration(Node):
     self.assignment = ' = ' #determined/changed by Statement_Vars type
   
   def build(self):
-    if len(self.compiler.tokens) == 0: self.compiler.error("must contain at least 1 token for valid syntax")
+    if not self.compiler.tokens.available(): self.compiler.error("must contain at least 1 token for valid syntax")
     if self.compiler.next() != Token.IDENTIFIER: self.compiler.error("IDENTIFIER token expected. Found " + self.compiler.next())
     
-    self.identifier = self.compiler.tokens[0] #identifier token
+    self.identifier = self.compiler.tokens.peek() #identifier token
     self.compiler.skip() # <identifier>
     
     if self.compiler.next() == Token.EQUALS:
@@ -134,6 +202,11 @@ class Declaration(Node):
       self.value = Expression(self.compiler).build() # (Expression) the value corresponding to the declaration
     return self
   
+  def optimize(self):
+    if self.value != None:
+      self.value = self.value.optimize()
+    return self
+  
   def compile(self, indent = 0):
     self.compiler.compiled.append(_indent(indent) + self.identifier.text)
     if self.value != None: #append the <expression> portion if the value is defined
@@ -151,7 +224,7 @@ class Declaration_List(Node):
     self.which = None #type of token the Statement_Var is.
   
   def build(self):
-    if len(self.compiler.tokens) == 0: self.compiler.error("must contain at least 1 token for valid syntax")
+    if not self.compiler.tokens.available(): self.compiler.error("must contain at least 1 token for valid syntax")
     if self.compiler.next() != Token.IDENTIFIER: self.compiler.error("IDENTIFIER token expected. Found " + self.compiler.next())
     
     while self.compiler.next() == Token.IDENTIFIER: #iterate through until we don't have any more declarations
@@ -178,6 +251,10 @@ class Declaration_List(Node):
           self.compiler.compiled.append(', ')
         self.declarations[-1].assignment = ' = '
         self.declarations[-1].compile(0)
+  
+  def optimize(self):
+    self.declarations = _optimize_all(self.declarations)
+    return self
 
 class Expression(Node):
   """
@@ -187,20 +264,22 @@ class Expression(Node):
   def __init__(self, compiler = None):
     Node.__init__(self, compiler) #call the parent abstract method
     self.expression = list() #the Tokens corresponding to the expression
+    self.tree = None #the expression parsed into Operations and Operands by optimize(), compiled instead of the tokens
   
   def build(self):
-    if len(self.compiler.tokens) == 0: self.compiler.error("must contain at least 1 token for valid syntax")
-    if self.compiler.next() not in self.compiler.valid_expression_tokens: self.compiler.error("EXPRESSION token expected. Found " + self.compiler.next())
+    if not self.compiler.tokens.available(): self.compiler.error("must contain at least 1 token for valid syntax")
+    if self.compiler.code() not in self.compiler.valid_expression_tokens: self.compiler.error("EXPRESSION token expected. Found " + self.compiler.next())
     
-    lparen, rparen = 0, 0
-    while self.compiler.next() in self.compiler.valid_expression_tokens:
-      self.expression.append(self.compiler.tokens[0])
+    lparen, rparen, last = 0, 0, None
+    while self.compiler.code() in self.compiler.valid_expression_tokens:
+      self.expression.append(self.compiler.tokens.peek())
       if self.compiler.next() == Token.LPAREN: lparen += 1
       if self.compiler.next() == Token.RPAREN: rparen += 1
+      last = self.compiler.tokens.mark() #position of the token about to be consumed
       self.compiler.skip(1)
     
     if rparen == lparen + 1 and self.expression[-1].type == Token.RPAREN: # we accidentally took too many parenthesis off (probably from the end of the condition).
-      self.compiler.tokens = [self.expression[-1]] + self.compiler.tokens
+      self.compiler.tokens.rewind(last)
       self.expression = self.expression[:-1]
     
     if len(self.expression) > 0 and self.expression[0].text == '-': #if there is a leading negative we need to trick PL/0 into thinking it's 0 - <exression>
@@ -209,8 +288,179 @@ class Expression(Node):
     
     return self
     
+  def optimize(self):
+    tree = _parse_expression(self.expression)
+    if tree != None: #expressions PL/0 can't take (like a * -1) are left as they are
+      self.tree = tree.fold(self.compiler.constants)
+    return self
+  
+  def value(self):
+    """
+    Returns the value of the expression if optimize() folded it to a single number, otherwise None.
+    """
+    return self.tree.value if self.tree != None else None
+  
   def compile(self, indent = 0):
-    self.compiler.compiled += [i.text for i in self.expression]
+    if self.tree != None:
+      self.compiler.compiled.append(self.tree.render(top = True))
+    else:
+      self.compiler.compiled += [i.text for i in self.expression]
+
+#precedence of the PL/0 operators
+_precedence = {'+' : 1, '-' : 1, '*' : 2, '/' : 2}
+
+class Operand():
+  """
+  Leaf of an expression tree: a number, an identifier or any other single token PL/0 takes as a factor.
+  """
+  
+  def __init__(self, text, value = None):
+    """
+    Operand initializer
+    text (string): The text of the token.
+    value (int, optional): The value if the operand is an integer constant.
+    """
+    self.text = text
+    self.value = value
+  
+  def fold(self, constants):
+    if self.value == None and constants.has_key(self.text):
+      return Operand(str(constants[self.text]), constants[self.text])
+    return self
+  
+  def render(self, top = False):
+    if self.value != None and self.value < 0: #PL/0 ignores a leading sign, so negative numbers are written as a subtraction
+      return ('0-%d' if top else '(0-%d)') % -self.value
+    return self.text
+
+class Operation():
+  """
+  Inner node of an expression tree: a binary operation on two subtrees.
+  """
+  
+  value = None #operations are never constant, fold() replaces constant ones by an Operand
+  
+  def __init__(self, op, left, right):
+    """
+    Operation initializer
+    op (string): One of + - * /
+    left (Operand or Operation): The left operand.
+    right (Operand or Operation): The right operand.
+    """
+    self.op = op
+    self.left = left
+    self.right = right
+  
+  def fold(self, constants):
+    """
+    Returns the tree with constants folded and identities removed. Arithmetic follows PL/0 on Python 2 integers, so / is floor division and division by zero is left for run time.
+    constants (dict): Values of the global constants.
+    """
+    op, left, right = self.op, self.left.fold(constants), self.right.fold(constants)
+    
+    if op in ('+', '*') and left.value != None and right.value == None: #keep constants on the right of commutative operations
+      left, right = right, left
+    
+    if left.value != None and right.value != None:
+      if op == '+': return _number(left.value + right.value)
+      if op == '-': return _number(left.value - right.value)
+      if op == '*': return _number(left.value * right.value)
+      if right.value != 0: return _number(left.value / right.value)
+      return Operation(op, left, right)
+    
+    #identities
+    if op in ('+', '-') and right.value == 0: return left # x+0 x-0
+    if op in ('*', '/') and right.value == 1: return left # x*1 x/1
+    if op == '+' and left.value == 0: return right # 0+x
+    if op == '-' and isinstance(left, Operand) and isinstance(right, Operand) and left.text == right.text: return _number(0) # x-x
+    
+    #reassociate chains of constants: (x+2)+3 => x+5, (x*2)*3 => x*6, (x/2)/3 => x/6
+    if right.value != None and isinstance(left, Operation) and left.right.value != None:
+      inner = left.right.value
+      if op in ('+', '-') and left.op in ('+', '-'):
+        total = (inner if left.op == '+' else -inner) + (right.value if op == '+' else -right.value)
+        return Operation('+', left.left, _number(total)).fold(constants)
+      if op == '*' and left.op == '*':
+        return Operation('*', left.left, _number(inner * right.value)).fold(constants)
+      if op == '/' and left.op == '/' and inner > 0 and right.value > 0:
+        return Operation('/', left.left, _number(inner * right.value)).fold(constants)
+    
+    if op in ('+', '-') and right.value != None and right.value < 0: # x+-3 => x-3
+      return Operation('-' if op == '+' else '+', left, _number(-right.value))
+    return Operation(op, left, right)
+  
+  def render(self, top = False):
+    """
+    Returns the PL/0 code of the tree with only the parenthesis it needs.
+    top (bool, optional): Whether the tree is a whole expression.
+    """
+    left, right = self.left.render(), self.right.render()
+    precedence = _precedence[self.op]
+    if isinstance(self.left, Operation) and _precedence[self.left.op] < precedence:
+      left = '(' + left + ')'
+    if isinstance(self.right, Operation) and (_precedence[self.right.op] < precedence or
+        (_precedence[self.right.op] == precedence and not (self.op == self.right.op and self.op in ('+', '*')))):
+      right = '(' + right + ')'
+    return left + self.op + right
+
+def _number(value):
+  """
+  Returns the Operand of an integer constant.
+  value (int): The value.
+  """
+  return Operand(str(value), value)
+
+def _parse_expression(tokens):
+  """
+  Parses the tokens of an Expression into a tree, or returns None if they are not a term list PL/0 accepts.
+  tokens (list): The Tokens of the expression.
+  """
+  pos = [0]
+  
+  def peek():
+    return tokens[pos[0]].text if pos[0] < len(tokens) else None
+  
+  def expression(top):
+    if peek() == '+' and top: #a leading + changes nothing
+      pos[0] += 1
+    tree = term()
+    while tree != None and peek() in ('+', '-'):
+      op = peek()
+      pos[0] += 1
+      right = term()
+      tree = Operation(op, tree, right) if right != None else None
+    return tree
+  
+  def term():
+    tree = factor()
+    while tree != None and peek() in ('*', '/'):
+      op = peek()
+      pos[0] += 1
+      right = factor()
+      tree = Operation(op, tree, right) if right != None else None
+    return tree
+  
+  def factor():
+    if pos[0] >= len(tokens):
+      return None
+    token = tokens[pos[0]]
+    pos[0] += 1
+    if token.type == Token.LPAREN:
+      tree = expression(False)
+      if peek() != ')':
+        return None
+      pos[0] += 1
+      return tree
+    if token.type == Token.NUMBER:
+      return Operand(token.text, int(token.text) if token.text.isdigit() else None)
+    if token.type in (Token.IDENTIFIER, Token.TRUE, Token.FALSE):
+      return Operand(token.text)
+    return None
+  
+  tree = expression(True)
+  if tree == None or pos[0] != len(tokens):
+    return None
+  return tree
 
 class Function(Node):
   """
@@ -228,12 +478,13 @@ class Function(Node):
     self.localvars.which = Token.VAR
   
   def build(self):
-    if len(self.compiler.tokens) <= 7: self.compiler.error('length must be greater than 7 for valid syntax')
+    if not self.compiler.tokens.available(8): self.compiler.error('length must be greater than 7 for valid syntax')
     if self.compiler.next() != Token.FUNCTION: self.compiler.error("FUNCTION token expected. Found " + self.compiler.next())
     if self.compiler.next(1) != Token.IDENTIFIER: self.compiler.error("IDENTIFIER token expected. Found " + self.compiler.next())
     if self.compiler.next(2) != Token.LPAREN: self.compiler.error("LPAREN token expected. Found " + self.compiler.next())
     
-    self.name = self.compiler.tokens[1].text
+    self.name = self.compiler.tokens.peek(1).text
+    self.line = self.compiler.tokens.peek(1).line
     self.compiler.skip(3) # function <IDENTIFIER> (
     self.parameters = Parameters(self.compiler).build()
     
@@ -267,13 +518,13 @@ class Function(Node):
       
       #global variable declaration
       global_dec = Declaration(self.compiler)
-      global_dec.identifier = Token(global_name, Token.IDENTIFIER, -1)
+      global_dec.identifier = Token(global_name, Token.IDENTIFIER, line = -1)
       self.compiler.program.global_var.append(global_dec)
       
       #local declaration before the BEGIN on the PROCEDURE
       local_dec = Declaration(self.compiler)
       localvar_statement = Statement_Var(self.compiler)
-      local_dec.identifier = Token(parameter.text, Token.IDENTIFIER, -1)
+      local_dec.identifier = Token(parameter.text, Token.IDENTIFIER, line = -1)
       self.localvars.declarations.declarations.append(local_dec)
       
       #correlate the global UPPER(<IDENTIFER>)<param_num> with the incoming parameter
@@ -281,21 +532,29 @@ class Function(Node):
       assign_decs = Declaration_List(self.compiler)
       assign_exp = Expression(self.compiler)
       assign_statement = Statement_Var(self.compiler)
-      assign_dec.identifier = Token(parameter.text, Token.IDENTIFIER, -1)
-      assign_exp.expression = [Token(global_name, Token.IDENTIFIER, -1)]
+      assign_dec.identifier = Token(parameter.text, Token.IDENTIFIER, line = -1)
+      assign_exp.expression = [Token(global_name, Token.IDENTIFIER, line = -1)]
       assign_dec.value = assign_exp
       assign_decs.declarations.append(assign_dec)
       assign_statement.declarations = assign_decs
+      assign_statement.line = self.line
+      assign_statement.origin = SourceLine.PARAMETER
       assign_statements.append(assign_statement)
     
     self.body = assign_statements + self.body
   
+  def optimize(self):
+    self.body = _optimize_all(self.body)
+    return self
+  
   def compile(self, indent = 0):
+    self.mark(SourceLine.FUNCTION)
     self.compiler.compiled.append(_indent(indent) + 'PROCEDURE ' + self.name + ';\n')
     self.localvars.compile(indent) #call the Statement_Vars which doesn't do anything if empty
     self.compiler.compiled.append(_indent(indent) + 'BEGIN\n')
     for statement in self.body:
       statement.compile(indent + 1)
+    self.compiler.compiled.append(SourceLine(None)) #the END belongs to no statement
     self.compiler.compiled.append(_indent(indent) + 'END;\n')
 
 class Parameters(Node):
@@ -309,10 +568,10 @@ class Parameters(Node):
     self.parameters = list() #list of tokens corresponding to the parameters
   
   def build(self):
-    if len(self.compiler.tokens) == 0: self.compiler.error("length must be greater than 0")
+    if not self.compiler.tokens.available(): self.compiler.error("length must be greater than 0")
     
     while self.compiler.next() in (Token.IDENTIFIER, Token.NUMBER):
-      self.parameters.append(self.compiler.tokens[0])
+      self.parameters.append(self.compiler.tokens.peek())
       self.compiler.skip(1) # <IDENTIFIER>
       
       if self.compiler.next() != Token.COMMA:
@@ -337,9 +596,9 @@ class Program(Node):
     self.global_const = list() #constants defined globally
   
   def build(self):
-    #(FALSE) if len(self.compiler.tokens) == 0: self.compiler.error('length must be greater than 0')
+    #(FALSE) if not self.compiler.tokens.available(): self.compiler.error('length must be greater than 0')
     
-    while len(self.compiler.tokens) > 0:
+    while self.compiler.tokens.available():
       #it's either a <FUNCTION> or <STATEMENT>
       if self.compiler.next() == Token.FUNCTION:
         self.functions.append(Function(self.compiler).build())
@@ -366,6 +625,7 @@ class Program(Node):
                 stmt = Statement_Var(self.compiler)
                 decs.declarations.append(declaration)
                 stmt.declarations = decs
+                stmt.line = statement.line
                 statements.append(stmt)
         elif statement.which == Token.CONST: #pull out global CONST to the top
           if statement.declarations != None:
@@ -379,7 +639,61 @@ class Program(Node):
     for function in self.functions:
       function.clean() #clean the function
   
+  def optimize(self):
+    #global constants are defined before anything runs, so their values can be folded into every expression
+    #only plain integer constants declared once are taken, anything else is left for the simulator to accept or reject
+    names = [declaration.identifier.text for declaration in self.global_const]
+    for declaration in self.global_const:
+      value = declaration.value.expression if declaration.value != None else None
+      if value != None and len(value) == 1 and value[0].type == Token.NUMBER and value[0].text.isdigit() and names.count(declaration.identifier.text) == 1:
+        self.compiler.constants[declaration.identifier.text] = int(value[0].text)
+    
+    #functions are optimized callees first so the calls they make are already inlined when their own size is measured
+    functions = dict([(function.name, function) for function in self.functions]) #a call goes to the last function of its name
+    calls = dict([(function.name, set([s.name for s in _statements(function.body) if isinstance(s, Statement_Function_Call)])) for function in self.functions])
+    done = set()
+    def visit(name, path):
+      if name in done or name in path or name not in functions:
+        return
+      for callee in sorted(calls[name]):
+        visit(callee, path + [name])
+      done.add(name)
+      function = functions[name]
+      self.compiler.function = function
+      function.optimize()
+      self.compiler.function = None
+      recursive = name in _reachable(calls, name)
+      initialized = [declaration for declaration in function.localvars.declarations.declarations if declaration.value != None]
+      if not recursive and not initialized and len(list(_statements(function.body))) <= self.compiler.inline_threshold:
+        self.compiler.inline[name] = function
+    for function in self.functions:
+      visit(function.name, [])
+    
+    self.statements = _optimize_all(self.statements)
+    return self
+  
   def compile(self, indent = 0):
+    #compile the functions and statements first, they can add variables (see Statement_Conditional) which are declared before them
+    compiled = self.compiler.compiled
+    self.compiler.compiled = list()
+    
+    #render the compiled functions to the program
+    for function in self.functions:
+      function.compile()
+      self.compiler.compiled.append('\n')
+    
+    #render the compiled statements to the program
+    if len(self.statements) > 0:
+      self.compiler.compiled.append(SourceLine(None)) #the BEGIN belongs to no statement
+      self.compiler.compiled.append('BEGIN\n')
+      for statement in self.statements:
+        statement.compile(1)
+      self.compiler.compiled.append(SourceLine(None))
+      self.compiler.compiled.append('END');
+    
+    body = self.compiler.compiled
+    self.compiler.compiled = compiled
+    
     #prepend the global constants to the program
     if len(self.global_const) > 0:
       self.compiler.compiled.append('CONST\n' + _indent(indent + 1))
@@ -398,17 +712,7 @@ class Program(Node):
       self.global_var[-1].compile(0)
       self.compiler.compiled.append(';\n\n')
     
-    #render the compiled functions to the program
-    for function in self.functions:
-      function.compile()
-      self.compiler.compiled.append('\n')
-    
-    #render the compiled statements to the program
-    if len(self.statements) > 0:
-      self.compiler.compiled.append('BEGIN\n')
-      for statement in self.statements:
-        statement.compile(1)
-      self.compiler.compiled.append('END');
+    self.compiler.compiled += body
     
     #put a random period at the end : )
     self.compiler.compiled.append('.\n')
@@ -423,16 +727,17 @@ class Statement(Node):
     self.statement = None
   
   def build(self):
-    if len(self.compiler.tokens) == 0: self.compiler.error("length must be greater than 0")
+    if not self.compiler.tokens.available(): self.compiler.error("length must be greater than 0")
     next = self.compiler.next()
-    if next not in self.compiler.valid_statement_tokens: self.compiler.error("invalid first <STATEMENT> token. Found " + next)
+    if self.compiler.code() not in self.compiler.valid_statement_tokens: self.compiler.error("invalid first <STATEMENT> token. Found " + next)
+    line = self.compiler.tokens.peek().line #line of the statement for the source map
     
     if next == Token.LBLOCK:
       self.compiler.skip(1) # {
       self.statement = Statement_List(self.compiler).build()
       if self.compiler.next() != Token.RBLOCK: self.compiler.error("RBLOCK token expected. Found " + self.compiler.next())
       self.compiler.skip(1) # }
-    elif next == Token.VAR or next == Token.CONST or (next == Token.IDENTIFIER and len(self.compiler.tokens) > 1 and self.compiler.next(1) != Token.LPAREN):
+    elif next == Token.VAR or next == Token.CONST or (next == Token.IDENTIFIER and self.compiler.tokens.available(2) and self.compiler.next(1) != Token.LPAREN):
       self.statement = Statement_Var(self.compiler).build()
     elif next == Token.IF:
       self.statement = Statement_Conditional(self.compiler).build()
@@ -444,6 +749,7 @@ class Statement(Node):
       self.statement = Statement_Empty(self.compiler).build()
     elif next == Token.IDENTIFIER:
       self.statement = Statement_Function_Call(self.compiler).build()
+    self.statement.line = line
     return self.statement
   
   def clean(self):
@@ -464,7 +770,7 @@ class Statement_Conditional(Node):
     self.else_statement = None
   
   def build(self):
-    if len(self.compiler.tokens) < 5: self.compiler.error("must contain at least 5 tokens for valid syntax")
+    if not self.compiler.tokens.available(5): self.compiler.error("must contain at least 5 tokens for valid syntax")
     if self.compiler.next() != Token.IF: self.compiler.error("IF token expected. Found " + self.compiler.next())
     if self.compiler.next(1) != Token.LPAREN: self.compiler.error("LPAREN token expected. Found " + self.compiler.next(1))
     
@@ -481,18 +787,50 @@ class Statement_Conditional(Node):
       self.else_statement = Statement(self.compiler).build()
     return self
   
+  def optimize(self):
+    self.condition = self.condition.optimize()
+    self.if_statement = self.if_statement.optimize() or Statement_Empty(self.compiler)
+    if self.else_statement != None:
+      self.else_statement = self.else_statement.optimize()
+    #a branch that can never run is dropped along with the condition
+    value = self.condition.value()
+    if value == True:
+      return self.if_statement
+    if value == False:
+      return self.else_statement
+    return self
+  
   def compile(self, indent):
+    if self.else_statement == None:
+      self.mark()
+      self.compiler.compiled.append(_indent(indent) + 'IF ')
+      self.condition.compile(indent + 1)
+      self.compiler.compiled.append(' THEN BEGIN\n')
+      self.if_statement.compile(indent + 1)
+      self.compiler.compiled.append(_indent(indent) + 'END;\n')
+      return
+    
+    #PL/0 has no ELSE, so the condition is evaluated once into a flag which the if branch clears.
+    #the flag is cleared at the end of the branch, after any recursive call which could have set it again.
+    flag = 'ELSE' + str(self.compiler.flags) #uppercase, so it can't collide with a Margs identifier
+    self.compiler.flags += 1
+    flag_dec = Declaration(self.compiler)
+    flag_dec.identifier = Token(flag, Token.IDENTIFIER, line = -1)
+    self.compiler.program.global_var.append(flag_dec)
+    
+    self.mark()
+    self.compiler.compiled.append(_indent(indent) + flag + ' := 1;\n')
     self.compiler.compiled.append(_indent(indent) + 'IF ')
     self.condition.compile(indent + 1)
     self.compiler.compiled.append(' THEN BEGIN\n')
     self.if_statement.compile(indent + 1)
+    self.mark()
+    self.compiler.compiled.append(_indent(indent + 1) + flag + ' := 0;\n')
+    self.compiler.compiled.append(_indent(indent) + 'END;\n')
+    self.mark(SourceLine.ELSE)
+    self.compiler.compiled.append(_indent(indent) + 'IF ' + flag + '=1 THEN BEGIN\n')
+    self.else_statement.compile(indent + 1)
     self.compiler.compiled.append(_indent(indent) + 'END;\n')
-    if self.else_statement != None: #need to use IF and invert conditional
-      self.compiler.compiled.append(_indent(indent) + 'IF ')
-      self.condition.compile(indent + 1, inverse = True)
-      self.compiler.compiled.append(' THEN BEGIN\n')
-      self.else_statement.compile(indent + 1)
-      self.compiler.compiled.append(_indent(indent) + 'END;\n')
 
 class Statement_Empty(Node):
   """
@@ -503,7 +841,7 @@ class Statement_Empty(Node):
     Node.__init__(self, compiler) #call the parent abstract method
   
   def build(self):
-    if len(self.compiler.tokens) == 0: self.compiler.error("must contain at least 1 token for valid syntax")
+    if not self.compiler.tokens.available(): self.compiler.error("must contain at least 1 token for valid syntax")
     if self.compiler.next() != Token.SEMI: self.compiler.error("SEMI token expected. Found " + self.compiler.next())
     self.compiler.skip(1) # ;
     return self
@@ -519,11 +857,11 @@ class Statement_Function_Call(Node):
     self.parameters = None
   
   def build(self):
-    if len(self.compiler.tokens) < 4: self.compiler.error('must contain at least 4 tokens for valid syntax')
+    if not self.compiler.tokens.available(4): self.compiler.error('must contain at least 4 tokens for valid syntax')
     if self.compiler.next() != Token.IDENTIFIER: self.compiler.error("IDENTIFIER token expected. Found " + self.compiler.next())
     if self.compiler.next(1) != Token.LPAREN: self.compiler.error("LPAREN token expected. Found " + self.compiler.next())
     
-    self.name = self.compiler.tokens[0].text
+    self.name = self.compiler.tokens.peek().text
     self.compiler.skip(2)
     
     if self.compiler.next() != Token.RPAREN: #the next token isn't a right parenthesis, so there must be Parameters
@@ -535,15 +873,12 @@ class Statement_Function_Call(Node):
     self.compiler.skip(2) # ) ;
     return self
   
-  def compile(self, indent):
-    if self.parameters != None: #if there are parameters in this call, we need to associate them with the global variables from the FUNCTION node.
-      fn = None
-      for _fn in self.compiler.program.functions: #get the function from the program
-        if _fn.name == self.name:
-          fn = _fn
-      if fn == None:
-        self.compiler.error('call to Undefined function (' + self.name + ')')
-        return
+  def arguments(self):
+    """
+    Returns the assignments passing the arguments of the call to the global variables of the function's parameters.
+    """
+    statements = list()
+    if self.parameters != None:
       param_num = 0
       while param_num < len(self.parameters.parameters):
         global_name = self.name.upper() + str(param_num)
@@ -553,15 +888,50 @@ class Statement_Function_Call(Node):
         assign_decs = Declaration_List(self.compiler)
         assign_exp = Expression(self.compiler)
         assign_statement = Statement_Var(self.compiler)
-        assign_dec.identifier = Token(global_name, Token.IDENTIFIER, -1)
+        assign_dec.identifier = Token(global_name, Token.IDENTIFIER, line = -1)
         assign_exp.expression = [self.parameters.parameters[param_num]]
         assign_dec.value = assign_exp
         assign_decs.declarations.append(assign_dec)
         assign_statement.declarations = assign_decs
-        assign_statement.compile(indent)
+        assign_statement.line = self.line
+        assign_statement.origin = SourceLine.ARGUMENT
+        statements.append(assign_statement)
         
         param_num += 1
+    return statements
+  
+  def optimize(self):
+    fn = self.compiler.inline.get(self.name)
+    count = len(self.parameters.parameters) if self.parameters != None else 0
+    if fn == None or count != len(fn.parameters.parameters):
+      return self
+    #a variable is only declared once the block declaring it runs, so the callee's locals are declared by the caller too
+    caller = self.compiler.function.localvars.declarations.declarations if self.compiler.function != None else self.compiler.program.global_var
+    declared = set([declaration.identifier.text for declaration in caller])
+    for declaration in fn.localvars.declarations.declarations:
+      if declaration.identifier.text not in declared:
+        local_dec = Declaration(self.compiler)
+        local_dec.identifier = declaration.identifier
+        caller.append(local_dec)
+        declared.add(declaration.identifier.text)
+    #the arguments still go through the parameter globals, so the order they are copied in doesn't matter
+    inlined = Statement_List(self.compiler)
+    inlined.statements = [statement.optimize() for statement in self.arguments()] + deepcopy(fn.body, {id(self.compiler) : self.compiler})
+    return inlined
+  
+  def compile(self, indent):
+    if self.parameters != None: #if there are parameters in this call, we need to associate them with the global variables from the FUNCTION node.
+      fn = None
+      for _fn in self.compiler.program.functions: #get the function from the program
+        if _fn.name == self.name:
+          fn = _fn
+      if fn == None:
+        self.compiler.error('call to Undefined function (' + self.name + ')')
+        return
+      for statement in self.arguments():
+        statement.compile(indent)
     
+    self.mark()
     self.compiler.compiled.append(_indent(indent) + 'CALL ' + self.name + ';\n')
 
 class Statement_IO(Node):
@@ -576,17 +946,17 @@ class Statement_IO(Node):
     self.identifier = None
   
   def build(self):
-    if len(self.compiler.tokens) < 3: self.compiler.error("must contain at least 3 tokens for valid syntax")
+    if not self.compiler.tokens.available(3): self.compiler.error("must contain at least 3 tokens for valid syntax")
     if self.compiler.next() not in (Token.INPUT, Token.OUTPUT): self.compiler.error("INPUT or OUTPUT token expected. Found " + self.compiler.next())
     
-    self.which = self.compiler.tokens[0]
+    self.which = self.compiler.tokens.peek()
     self.compiler.skip(1) # INPUT | OUTPUT
     
     if self.which.type == Token.OUTPUT:
       self.expression = Expression(self.compiler).build() #outputs can be expressions, inputs need to be identifiers
     else: # it is INPUT
       if self.compiler.next() != Token.IDENTIFIER: self.compiler.error("IDENTIFIER token expected. Found " + self.compiler.next())
-      self.identifier = self.compiler.tokens[0].text
+      self.identifier = self.compiler.tokens.peek().text
       self.compiler.skip(1) # <idenfifier>
     
     if self.compiler.next() != Token.SEMI: self.compiler.error("SEMI token expected. Found " + self.compiler.next())
@@ -594,7 +964,13 @@ class Statement_IO(Node):
     self.compiler.skip(1) # ;
     return self
   
+  def optimize(self):
+    if self.expression != None:
+      self.expression = self.expression.optimize()
+    return self
+  
   def compile(self, indent):
+    self.mark()
     if self.identifier != None:
       self.compiler.compiled.append(_indent(indent) + '@ ' + self.identifier + ';\n')
     else:
@@ -614,7 +990,7 @@ class Statement_Iteration(Node):
     self.body = None #the body to execute of the system.
   
   def build(self):
-    if len(self.compiler.tokens) < 5: self.compiler.error("must contain at least 5 tokens for valid syntax")
+    if not self.compiler.tokens.available(5): self.compiler.error("must contain at least 5 tokens for valid syntax")
     if self.compiler.next() != Token.WHILE: self.compiler.error("WHILE token expected. Found " + self.compiler.next())
     if self.compiler.next(1) != Token.LPAREN: self.compiler.error("LPAREN token expected. Found " + self.compiler.next(1))
     
@@ -627,7 +1003,15 @@ class Statement_Iteration(Node):
     self.body = Statement(self.compiler).build()
     return self
   
+  def optimize(self):
+    self.condition = self.condition.optimize()
+    self.body = self.body.optimize() or Statement_Empty(self.compiler)
+    if self.condition.value() == False: #the loop never runs
+      return None
+    return self
+  
   def compile(self, indent):
+    self.mark()
     self.compiler.compiled.append(_indent(indent) + 'WHILE ')
     self.condition.compile(indent + 1)
     self.compiler.compiled.append(' DO BEGIN\n')
@@ -644,12 +1028,16 @@ class Statement_List(Node):
     self.statements = list() #statments in the block
   
   def build(self):
-    if len(self.compiler.tokens) == 0: self.compiler.error("length must be greater than 0")
+    if not self.compiler.tokens.available(): self.compiler.error("length must be greater than 0")
     
-    while len(self.compiler.tokens) > 0 and self.compiler.next() in self.compiler.valid_statement_tokens:
+    while self.compiler.tokens.available() and self.compiler.code() in self.compiler.valid_statement_tokens:
       self.statements.append(Statement(self.compiler).build())
     return self
   
+  def optimize(self):
+    self.statements = _optimize_all(self.statements)
+    return self
+  
   def compile(self, indent):
     if len(self.statements) > 0:
       for statement in self.statements:
@@ -661,10 +1049,10 @@ class Statement_List(Node):
     self.identifier = None
   
   def build(self):
-    if len(self.compiler.tokens) < 2: self.compiler.error("must contain at least 2 tokens for valid syntax")
+    if not self.compiler.tokens.available(2): self.compiler.error("must contain at least 2 tokens for valid syntax")
     if self.compiler.next() != Token.RETURN: self.compiler.error("RETURN token expected. Found " + self.compiler.next())
     
-    self.identifier = self.compiler.tokens[1] if self.compiler.next(1) == Token.IDENTIFIER else None
+    self.identifier = self.compiler.tokens.peek(1) if self.compiler.next(1) == Token.IDENTIFIER else None
     
     if self.identifier != None:
       self.compiler.skip(1) # <identifier>
@@ -687,9 +1075,9 @@ class Statement_Var(Node):
     self.declarations = None
   
   def build(self):
-    if len(self.compiler.tokens) == 0: self.compiler.error("length must be greater than 0")
+    if not self.compiler.tokens.available(): self.compiler.error("length must be greater than 0")
     
-    self.which = self.compiler.tokens[0].type if (self.compiler.next() == Token.VAR or self.compiler.next() == Token.CONST) else None
+    self.which = self.compiler.tokens.peek().type if (self.compiler.next() == Token.VAR or self.compiler.next() == Token.CONST) else None
     
     if self.which != None:
       self.compiler.skip(1) # var | const
@@ -701,9 +1089,14 @@ class Statement_Var(Node):
     self.compiler.skip(1) # ;
     return self
   
+  def optimize(self):
+    self.declarations = self.declarations.optimize()
+    return self
+  
   def compile(self, indent):
     self.declarations.which = self.which
     if len(self.declarations.declarations) > 0:
+      self.mark()
       if self.which != None:
         self.compiler.compiled.append(_indent(indent) + ('VAR ' if self.which == Token.VAR else 'CONST '))
       self.declarations.compile(indent)
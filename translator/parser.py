@@ -1,4 +1,6 @@
-import os, re, string
+import os, re, mmap
+from array import array
+from itertools import islice
 
 #valid literal keywords (non identifiers) used in the tokenizing process
 literal_words = {
@@ -32,6 +34,26 @@ literal_words = {
   'while' : 'WHILE'
 }
 
+#names of the token types, the type code of a token in a TokenTable is the position of its name
+TYPES = ('IDENTIFIER', 'NUMBER', 'ILLEGAL') + tuple(sorted(set(literal_words.values())))
+
+#name : type code of every token type
+CODES = dict([(name, code) for code, name in enumerate(TYPES)])
+
+#master pattern used by Parser.scan(). Leading whitespace is skipped and the alternatives are tried in order: symbols, words, numbers, then any other character
+token_pattern = re.compile(r"""
+  [^\S\n]*
+  (?:
+    (?P<newline>\n) |
+    (?P<symbol><=|>=|!=|==|[<>+\-*/(){}=,;]) |
+    (?P<word>[a-zA-Z]\w*) |
+    (?P<number>[\.\d]+) |
+    (?P<illegal>\S)
+  )""", re.VERBOSE)
+
+#identifiers are made of lowercase letters only
+identifier_pattern = re.compile('[a-z]+$')
+
 class Parser():
   def __init__(self, filename):
     """
@@ -40,60 +62,90 @@ class Parser():
     """
     self.filename = filename
     self.errors = list() #list of errors during tokenizing.
-    self.tokens = list() #list of tokens produced during tokenizing.
-    self.lines = list() #lines of code to parse (usually from input file but can be overridden).
+    self.tokens = TokenTable() #tokens produced during tokenizing.
+    self.lines = list() #lines of code to parse (can be set instead of loading a file).
+    self.source = None #source code buffer read by loadFile().
     self.legal = True #whether all of the tokens were legal or not.
   
   def loadFile(self):
     if not os.path.exists(self.filename):
       self.errors.append('Input program ' + self.filename + ' does not exist.')
     else:
-      self.lines = file(self.filename, 'r').readlines()
+      f = open(self.filename, 'r')
+      self.source = f.read()
+      f.close()
     return self
   
   def parse(self):
-    line_num = 0
-    for line in self.lines:
-      line_num += 1
-      line = line.strip()
-      if len(line) == 0: continue
-      self.tokenize(line, line_num)
+    if self.source == None: #no file was loaded, use the lines given to the parser
+      self.source = '\n'.join([line.rstrip('\n') for line in self.lines])
+    self.scan(self.source)
     return self
   
-  def tokenize(self, line, line_num):
-    while line:
-      line = line.lstrip() #remove all leading whitespace
-      if not line: continue #skip if it's an empty line
-      if line[:2] in ('<=', '>=', '!=', '=='):
-        self.tokens.append(Token(line[:2], literal_words[line[:2]], line=line_num))
-        line = line[2:]
-      elif line[0] in ('<', '>', '+', '-', '*', '/', '(', ')', '{', '}', '=', ',', ';'):
-        self.tokens.append(Token(line[0], literal_words[line[0]], line=line_num))
-        line = line[1:]
-      else:
-        m = re.match('[a-zA-Z]\w*', line)
-        if m:
-          text = m.group()
-          if literal_words.has_key(text):
-            t = Token(text, literal_words[text], line=line_num) #keyword
-          elif set(text).issubset(set(string.lowercase)):
-            t = Token(text, Token.IDENTIFIER, line=line_num) #identifier
-          else:
-            t = Token(text, Token.ILLEGAL, False, line=line_num) #is all alphanumeric but contains uppercase and isnt a keyword
-          self.tokens.append(t)
-          line = line[len(text):]
+  def scan(self, text, line_num = 1):
+    """
+    Tokenize a buffer of source code in a single pass of the master pattern.
+    text (string): The source code to tokenize.
+    line_num (int, optional): The line number the buffer starts on.
+    """
+    add = self.tokens.add
+    for token in self._scan(text, line_num):
+      add(*token)
+  
+  def _scan(self, text, line_num):
+    """
+    Generator behind scan() and stream(). Yields (text, type, line) of every token of a buffer without building Tokens.
+    text (string or mmap): The source code to tokenize.
+    line_num (int): The line number the buffer starts on.
+    """
+    for m in token_pattern.finditer(text):
+      kind = m.lastgroup
+      if kind == 'word':
+        word = m.group(kind)
+        if word in literal_words:
+          yield word, literal_words[word], line_num #keyword
+        elif identifier_pattern.match(word):
+          yield word, Token.IDENTIFIER, line_num #identifier
         else:
-          m = re.match('[\.\d]+', line) #numeric regex (not perfect, fails for 1.2.3.4)
-          if m: #numbers
-            text = m.group()
-            self.tokens.append(Token(text, Token.NUMBER, line=line_num))
-            line = line[len(text):]
-          else: #illegal token
-            self.legal = False;
-            m = re.match('(\S)\s', line) #illegal, so we'll get everything before the next space
-            text = m.group(1)
-            self.tokens.append(Token(text, Token.ILLEGAL, False, line=line_num))
-            line = line[len(text):]
+          yield word, Token.ILLEGAL, line_num #is all alphanumeric but contains uppercase and isnt a keyword
+      elif kind == 'symbol':
+        symbol = m.group(kind)
+        yield symbol, literal_words[symbol], line_num
+      elif kind == 'newline':
+        line_num += 1
+      elif kind == 'number':
+        yield m.group(kind), Token.NUMBER, line_num
+      else: #illegal character
+        self.legal = False
+        yield m.group(kind), Token.ILLEGAL, line_num
+  
+  def stream(self, source = None):
+    """
+    Tokenize lazily instead of collecting every token in self.tokens. Returns a TokenTable which is filled as the Compiler reads ahead.
+    source (string, file or mmap, optional): Source code, open file (read line by line) or mmap'd buffer to tokenize. The parser's file is opened when omitted.
+    """
+    if source == None:
+      if not os.path.exists(self.filename):
+        self.errors.append('Input program ' + self.filename + ' does not exist.')
+        return TokenTable()
+      source = open(self.filename, 'r')
+    if isinstance(source, (str, mmap.mmap)):
+      return TokenTable(self._scan(source, 1))
+    return TokenTable(self._scanlines(source))
+  
+  def _scanlines(self, f):
+    """
+    Yield (text, type, line) of the tokens of an open file one line at a time, so only the current line is held in memory.
+    f (file): The file to tokenize. It is closed once exhausted.
+    """
+    try:
+      line_num = 0
+      for line in f:
+        line_num += 1
+        for token in self._scan(line, line_num):
+          yield token
+    finally:
+      f.close()
   
   def __str__(self):
     """
@@ -101,10 +153,12 @@ class Parser():
     """
     return '\n'.join([str(token) for token in self.tokens])
 
-class Token():
+class Token(object):
   IDENTIFIER = 'IDENTIFIER'
   NUMBER = 'NUMBER'
   ILLEGAL = 'ILLEGAL'
+  
+  __slots__ = ('text', 'type', 'legal', 'line')
 
   def __init__(self, text, _type, legal = True, line = 0):
     """
@@ -118,7 +172,6 @@ class Token():
     self.type = _type
     self.legal = legal
     self.line = line
-    self.value = None
 
   def __str__(self):
     """
@@ -128,3 +181,83 @@ class Token():
 
 #map all of the literal_words values and give Token the corresponding attribute. Nice hack.
 map(lambda t: setattr(Token, t, t), literal_words.values())
+
+class TokenTable():
+  """
+  Compact store of the tokens of a program. The type codes (see TYPES), line numbers and texts are kept in parallel arrays, the texts as positions in a pool of interned strings, so a token costs a few bytes instead of an object. Tokens are only built when an entry is read.
+  A table made by Parser.stream() pulls its tokens from the scanner as they are needed (see fill()).
+  """
+  
+  def __init__(self, source = None):
+    """
+    TokenTable initializer
+    source (iterator, optional): (text, type, line) of the tokens still to be added, the table is complete when omitted
+    """
+    self.source = source
+    self.types = array('B') #type code of every token
+    self.lines = array('i') #line of every token
+    self.texts = array('i') #position of the text of every token in pool
+    self.pool = list() #every distinct token text
+    self.index = dict() #text : position in pool
+  
+  def add(self, text, _type, line):
+    """
+    Append a token.
+    text (string): Raw text in the token
+    _type (string): Type of token (Token.IDENTIFIER, Token.NUMBER, Token.ILLEGAL or found in literal_words.values())
+    line (int): Line number the token was found on
+    """
+    i = self.index.get(text)
+    if i == None:
+      i = self.index[text] = len(self.pool)
+      self.pool.append(intern(text))
+    self.texts.append(i)
+    self.types.append(CODES[_type])
+    self.lines.append(line)
+  
+  def append(self, token):
+    """
+    Append a Token.
+    token (Token): The token to store.
+    """
+    self.add(token.text, token.type, token.line)
+  
+  def fill(self, count):
+    """
+    Add tokens from the source until the table holds count of them. Returns whether it does.
+    count (int): The number of tokens needed.
+    """
+    if self.source != None and len(self.types) < count:
+      add = self.add
+      for token in islice(self.source, count - len(self.types)):
+        add(*token)
+      if len(self.types) < count: #the source ran out
+        self.source = None
+    return len(self.types) >= count
+  
+  def drop(self, count):
+    """
+    Discard the first count tokens, the positions of the others move down by count. The text pool is kept.
+    count (int): The number of tokens to discard.
+    """
+    del self.types[:count]
+    del self.lines[:count]
+    del self.texts[:count]
+  
+  def type(self, i):
+    """
+    Return the type of the token at position i without building the Token.
+    i (int): Position of the token.
+    """
+    return TYPES[self.types[i]]
+  
+  def __len__(self):
+    return len(self.types)
+  
+  def __getitem__(self, i):
+    _type = TYPES[self.types[i]]
+    return Token(self.pool[self.texts[i]], _type, _type != Token.ILLEGAL, self.lines[i])
+  
+  def __iter__(self):
+    for i in xrange(len(self.types)):
+      yield self[i]
@@ -0,0 +1,125 @@
+import re, json
+
+#messages of the simulator which name a PL/0 line
+line_pattern = re.compile(r'\bat line (\d+)')
+
+class SourceLine(str):
+  """
+  Marker the nodes put in Compiler.compiled in front of the PL/0 code of a statement. An empty string, so the compiled code is joined as it is and str(compiler) is unchanged.
+  """
+
+  #kinds of emitted code
+  STATEMENT = 'statement' #code of a Margs statement
+  FUNCTION = 'function' #the PROCEDURE header and local declarations of a function
+  ELSE = 'else' #the IF on the flag generated for an else branch (Statement_Conditional.compile)
+  PARAMETER = 'parameter' #assignment copying a parameter in from its global (Function.clean)
+  ARGUMENT = 'argument' #assignment copying an argument to the parameter global (Statement_Function_Call.compile)
+
+  def __new__(cls, line, kind = STATEMENT):
+    """
+    SourceLine constructor
+    line (int): Margs line of the code emitted next, None for code which belongs to no statement
+    kind (string): One of the kinds above
+    """
+    self = str.__new__(cls)
+    self.line = line
+    self.kind = kind
+    return self
+
+class SourceMap():
+  def __init__(self, lines = None, source = None):
+    """
+    Map from the lines of an emitted PL/0 program to the Margs lines they were translated from.
+    lines (dict, optional): PL/0 line : (Margs line, kind)
+    source (string, optional): Name of the Margs file.
+    """
+    self.lines = lines if lines != None else dict()
+    self.source = source
+
+  def lookup(self, line):
+    """
+    Returns (Margs line, kind) of a PL/0 line, or None for code which belongs to no statement (BEGIN, END, declarations).
+    line (int): The PL/0 line.
+    """
+    return self.lines.get(line)
+
+  def describe(self, line):
+    """
+    Returns a short description of the Margs origin of a PL/0 line, or None.
+    line (int): The PL/0 line.
+    """
+    origin = self.lookup(line)
+    if origin == None:
+      return None
+    margs, kind = origin
+    text = 'Margs line ' + str(margs)
+    if kind in (SourceLine.PARAMETER, SourceLine.ARGUMENT):
+      text += ', ' + kind + ' passing'
+    return text
+
+  def annotate(self, message):
+    """
+    Adds the Margs line to every "at line N" of a simulator message.
+    message (string): The message naming PL/0 lines.
+    """
+    def replace(m):
+      text = self.describe(int(m.group(1)))
+      return m.group(0) if text == None else m.group(0) + ' (' + text + ')'
+    return line_pattern.sub(replace, message)
+
+  def save(self, outfile):
+    """
+    Writes the map as JSON.
+    outfile (string or file): File name or open file to write to.
+    """
+    f = open(outfile, 'w') if isinstance(outfile, str) else outfile
+    json.dump(self.dump(), f, separators=(',', ':'))
+    if isinstance(outfile, str):
+      f.close()
+
+  def dump(self):
+    """
+    Returns the map as a JSON compatible dict.
+    """
+    return {
+      'version' : 1,
+      'source' : self.source,
+      'mappings' : [[pl0, margs, kind] for pl0, (margs, kind) in sorted(self.lines.items())]
+    }
+
+def build(compiled, source = None):
+  """
+  Builds the SourceMap of a compiled program. A SourceLine applies to the PL/0 line it is found on and the lines after it, up to the next SourceLine.
+  compiled (list): Compiler.compiled, the code and markers produced by Program.compile().
+  source (string, optional): Name of the Margs file.
+  """
+  lines = dict()
+  line, current, start = 1, None, 0
+  #the code between two markers is joined and its lines counted at once
+  for i in [i for i, item in enumerate(compiled) if isinstance(item, SourceLine)] + [len(compiled)]:
+    newlines = ''.join(compiled[start:i]).count('\n')
+    if current != None:
+      for n in range(line + 1, line + newlines + 1):
+        lines[n] = current
+    line += newlines
+    if i == len(compiled):
+      break
+    item = compiled[i]
+    current = (item.line, item.kind) if item.line != None else None
+    if current != None:
+      lines[line] = current
+    else:
+      lines.pop(line, None)
+    start = i + 1
+  return SourceMap(lines, source)
+
+def load(infile):
+  """
+  Reads a map written by SourceMap.save().
+  infile (string or file): File name or open file to read from.
+  """
+  f = open(infile, 'r') if isinstance(infile, str) else infile
+  data = json.load(f)
+  if isinstance(infile, str):
+    f.close()
+  return SourceMap(dict([(pl0, (margs, str(kind))) for pl0, margs, kind in data['mappings']]), data.get('source'))